@@ -0,0 +1,68 @@
+"""
+Form extraction benchmark
+Times the BeautifulSoup path, the fast tokenizer and schema-driven targeted
+extraction on saved login and twofa pages, and checks all return the same fields.
+
+Usage:
+  python benchmarks/bench_forms.py                  (uses benchmarks/pages/*.html)
+  python benchmarks/bench_forms.py page.html ...    (e.g. pages saved from a recorded run)
+  BENCH_ITERATIONS=2000 python benchmarks/bench_forms.py
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stocko_accounts import Account
+from stocko_auto_login_GJ114_API_V2 import StockoAPILoginV2
+from stocko_forms import FormSchemaCache, fast_extract_form_fields
+
+PAGES_DIR = Path(__file__).parent / 'pages'
+DEFAULT_ITERATIONS = 500
+
+
+def time_per_call(func, html, iterations):
+    """Mean seconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(html)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    paths = [Path(p) for p in sys.argv[1:]] or sorted(PAGES_DIR.glob('*.html'))
+    if not paths:
+        print(f"ERROR: No pages found in {PAGES_DIR}")
+        sys.exit(1)
+    iterations = int(os.getenv('BENCH_ITERATIONS', DEFAULT_ITERATIONS))
+    engine = StockoAPILoginV2(Account('BENCH'))
+    schemas = FormSchemaCache(cache_path=None)
+
+    print(f"{'Page':<20} {'Bytes':>7} {'bs4 (us)':>10} {'fast (us)':>10} {'schema (us)':>12}  Match")
+    print(f"{'-'*20} {'-'*7} {'-'*10} {'-'*10} {'-'*12}  {'-'*5}")
+    total_bs4 = total_fast = total_schema = 0.0
+    mismatches = 0
+    for path in paths:
+        html = path.read_text(encoding='utf-8')
+        expected = engine._extract_form_fields_bs4(html)
+        schemas.learn(path.stem, html, expected)
+        match = expected == fast_extract_form_fields(html) == schemas.extract(path.stem, html)
+        mismatches += not match
+        bs4_time = time_per_call(engine._extract_form_fields_bs4, html, iterations)
+        fast_time = time_per_call(fast_extract_form_fields, html, iterations)
+        schema_time = time_per_call(lambda page: schemas.extract(path.stem, page), html, iterations)
+        total_bs4 += bs4_time
+        total_fast += fast_time
+        total_schema += schema_time
+        print(f"{path.name:<20} {len(html):>7} {bs4_time * 1e6:>10.1f} {fast_time * 1e6:>10.1f} "
+              f"{schema_time * 1e6:>12.1f}  {'✅' if match else '❌'}")
+
+    print(f"\nPer login ({len(paths)} pages): bs4 {total_bs4 * 1e3:.3f}ms, fast {total_fast * 1e3:.3f}ms, "
+          f"schema {total_schema * 1e3:.3f}ms CPU")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
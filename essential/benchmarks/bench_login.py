@@ -0,0 +1,309 @@
+"""
+Login benchmark suite
+Runs the requests (sync) and asyncio engines against the stand-in server
+(benchmarks/fake_stocko.py, started in a subprocess so its CPU isn't counted)
+at several concurrency levels and reports, per engine and concurrency:
+
+  - login latency p50 / p95 / p99 (ms) and throughput (logins/s)
+  - CPU per login (ms, this process), resident memory after the scenario and
+    its growth during it (MB, Linux only - read from /proc/self/statm)
+  - extract_form_fields() median inside real logins (us, the form_extract/twofa_extract steps)
+  - notifier median on the login path (us, the notify step) and time to drain the queue (ms)
+
+plus extract_form_fields() per call on the saved pages (best of 5). Results
+are compared with a stored baseline; anything worse by more than --tolerance
+(and by more than a small absolute noise floor) is flagged and the exit
+status is 1, so it can gate CI.
+
+Usage:
+  python benchmarks/bench_login.py                                  (compare with the baseline if there is one)
+  python benchmarks/bench_login.py --save-baseline                  (store this run as the baseline)
+  python benchmarks/bench_login.py --engines async --concurrency 50 200 --logins 400
+  python benchmarks/bench_login.py --latency 0.1 --jitter 0.03 --tolerance 0.25
+
+Baselines are machine-specific: save one on the machine (and with the
+--latency) you compare on, which is why none is committed. CI
+(.github/workflows/bench-login.yml) saves one from the pull request's base
+commit and compares the head with it on the same runner. Tail percentiles
+need samples - use a few hundred --logins when comparing p99.
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import platform
+import secrets
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import pyotp
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stocko_accounts import Account
+from stocko_auto_login_GJ114_API_V2 import StockoAPILoginV2
+from stocko_batch_login import run_batch
+from stocko_async_login import run_batch as run_batch_async
+from stocko_forms import SCHEMA_CACHE
+from stocko_log import configure_logging
+from stocko_notify import NOTIFIER
+from stocko_timing import TIMINGS_ENV
+from stocko_totp import ClockSkew
+
+BENCH_DIR = Path(__file__).parent
+PAGES_DIR = BENCH_DIR / 'pages'
+DEFAULT_BASELINE = BENCH_DIR / 'baselines' / 'bench_login.json'
+SERVER_SCRIPT = BENCH_DIR / 'fake_stocko.py'
+SERVER_PORT = 8791
+ENGINES = ('sync', 'async')
+DEFAULT_CONCURRENCY = (1, 8, 32)
+DEFAULT_LOGINS = 48
+DEFAULT_LATENCY = 0.02
+DEFAULT_TOLERANCE = 0.15
+EXTRACT_ITERATIONS = 1000
+EXTRACT_REPEATS = 5
+NOISE_FLOOR = {'_us': 20.0, '_ms': 5.0, '_mb': 5.0}  # smaller absolute changes are never regressions
+HIGHER_IS_BETTER = {'throughput_per_s'}
+NOT_COMPARED = {'logins', 'notifier_drain_ms'}  # the drain is paced by the Telegram rate limits
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (None for no values)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def current_rss_mb():
+    """Resident memory of this process right now (None where /proc isn't available)
+
+    Unlike ru_maxrss this goes down again, so each scenario gets its own reading.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def start_server(port, latency, jitter, error_rate=0.0):
+    """fake_stocko.py in a subprocess, returns (process, url) once it answers"""
+    url = f"http://localhost:{port}"
+    process = subprocess.Popen(
+        [sys.executable, str(SERVER_SCRIPT), '--port', str(port), '--latency', str(latency),
+         '--jitter', str(jitter), '--error-rate', str(error_rate), '--seed', '1'],
+        stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/_admin/stats", timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"fake_stocko.py did not start on port {port}")
+
+
+def make_accounts(url, count, notify=True):
+    """`count` fresh accounts, registered with the stand-in server (each with its own Telegram chat)"""
+    accounts = [
+        Account(f"B{i:05d}", f"B{i:05d}", secrets.token_urlsafe(12), pyotp.random_base32(), '1000',
+                telegram_bot_token='bench' if notify else None, telegram_chat_id=str(10000 + i) if notify else None)
+        for i in range(count)
+    ]
+    payload = [{'username': a.username, 'password': a.password, 'totp_secret': a.totp_secret} for a in accounts]
+    requests.post(f"{url}/_admin/accounts", json=payload, timeout=30).raise_for_status()
+    return accounts
+
+
+def run_logins(engine, accounts, concurrency):
+    clock = ClockSkew(cache_path=None)
+    if engine == 'sync':
+        return run_batch(accounts, concurrency, clock=clock)
+    return asyncio.run(run_batch_async(accounts, concurrency, clock=clock))
+
+
+def read_steps(path):
+    """Step name -> wall times (us) from the login_timing records in `path`"""
+    steps = {}
+    with open(path) as f:
+        for line in f:
+            for step in json.loads(line)['steps']:
+                steps.setdefault(step['step'], []).append(step['wall_ms'] * 1000)
+    return steps
+
+
+def run_scenario(engine, concurrency, accounts, timings_path):
+    """One engine at one concurrency level; returns its metrics"""
+    open(timings_path, 'w').close()
+    rss_start = current_rss_mb()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    results = run_logins(engine, accounts, concurrency)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    drain_start = time.perf_counter()
+    NOTIFIER.flush(timeout=120)
+    drain = time.perf_counter() - drain_start
+
+    rss = current_rss_mb()
+    steps = read_steps(timings_path)
+    durations = [r['duration'] * 1000 for r in results if r['success']]
+    extract = steps.get('form_extract', []) + steps.get('twofa_extract', [])
+    return {
+        'logins': len(results),
+        'errors': len(results) - len(durations),
+        'p50_ms': _round(percentile(durations, 50)),
+        'p95_ms': _round(percentile(durations, 95)),
+        'p99_ms': _round(percentile(durations, 99)),
+        'throughput_per_s': _round(len(durations) / wall),
+        'cpu_ms_per_login': _round(cpu * 1000 / len(results)),
+        'rss_mb': _round(rss, 1),
+        'rss_growth_mb': _round(rss - rss_start, 1) if rss is not None and rss_start is not None else None,
+        'extract_p50_us': _round(percentile(extract, 50), 1),
+        'notify_p50_us': _round(percentile(steps.get('notify', []), 50), 1),
+        'notifier_drain_ms': _round(drain * 1000, 1),
+    }
+
+
+def bench_extract():
+    """extract_form_fields() per call on the saved pages: schema path and full parse (best of EXTRACT_REPEATS)"""
+    engine = StockoAPILoginV2(Account('BENCH'))
+    metrics = {}
+    for kind in ('login', 'twofa'):
+        html = (PAGES_DIR / f'{kind}.html').read_text(encoding='utf-8')
+        for label, page_kind in (('schema', kind), ('parse', None)):
+            engine.extract_form_fields(html, page_kind)  # learn the schema
+            best = float('inf')
+            for _ in range(EXTRACT_REPEATS):
+                start = time.perf_counter()
+                for _ in range(EXTRACT_ITERATIONS):
+                    engine.extract_form_fields(html, page_kind)
+                best = min(best, time.perf_counter() - start)
+            metrics[f'{kind}_{label}_us'] = _round(best / EXTRACT_ITERATIONS * 1e6, 1)
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """(scenario, metric, baseline, current, change) for every metric worse than the tolerance allows"""
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(scenario, {}).get(metric)
+            if metric in NOT_COMPARED or value is None or old is None:
+                continue
+            floor = next((v for suffix, v in NOISE_FLOOR.items() if metric.endswith(suffix)), 0.0)
+            if abs(value - old) <= floor:
+                continue
+            if metric == 'errors':
+                worse = value > old
+            elif metric in HIGHER_IS_BETTER:
+                worse = value < old * (1 - tolerance)
+            else:
+                worse = value > old * (1 + tolerance)
+            if worse:
+                change = (value - old) / old * 100 if old else float('inf')
+                regressions.append((scenario, metric, old, value, change))
+    return regressions
+
+
+def print_results(results):
+    columns = ('logins', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s', 'cpu_ms_per_login',
+               'rss_mb', 'rss_growth_mb', 'extract_p50_us', 'notify_p50_us', 'notifier_drain_ms')
+    headers = ('Logins', 'Err', 'p50 ms', 'p95 ms', 'p99 ms', 'logins/s', 'CPU ms', 'RSS MB',
+               'RSS +MB', 'extract us', 'notify us', 'drain ms')
+    print(f"\n{'Scenario':<12} " + ' '.join(f"{h:>10}" for h in headers))
+    print(f"{'-'*12} " + ' '.join('-' * 10 for _ in headers))
+    for scenario, metrics in results.items():
+        if scenario == 'extract_form_fields':
+            continue
+        print(f"{scenario:<12} " + ' '.join(f"{'-' if metrics[c] is None else metrics[c]:>10}" for c in columns))
+    print("\nextract_form_fields per call: " + ', '.join(
+        f"{name} {value}us" for name, value in results['extract_form_fields'].items()))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the login engines against the stand-in server")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=list(DEFAULT_CONCURRENCY))
+    parser.add_argument('--logins', type=int, default=DEFAULT_LOGINS, help="logins per scenario")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help="server latency per response (s)")
+    parser.add_argument('--jitter', type=float, default=DEFAULT_LATENCY / 4)
+    parser.add_argument('--no-notify', action='store_true', help="accounts without Telegram (no notifier path)")
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before a metric counts as a regression")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    configure_logging(level='WARNING')
+    SCHEMA_CACHE.cache_path = None  # don't overwrite the real pages' learned schema
+    process, url = start_server(args.port, args.latency, args.jitter)
+    os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = url
+    NOTIFIER.api_url = url
+    timings_fd, timings_path = tempfile.mkstemp(suffix='.jsonl')
+    os.close(timings_fd)
+    os.environ[TIMINGS_ENV] = timings_path
+
+    results = {}
+    try:
+        accounts = make_accounts(url, args.logins, notify=not args.no_notify)
+        for engine in args.engines:
+            run_logins(engine, accounts[:min(4, len(accounts))], 4)  # warm-up: imports, schema, connections
+            NOTIFIER.flush(timeout=120)
+            for concurrency in args.concurrency:
+                scenario = f"{engine}-c{concurrency}"
+                print(f"Running {scenario} ({args.logins} logins)...")
+                results[scenario] = run_scenario(engine, concurrency, accounts, timings_path)
+        results['extract_form_fields'] = bench_extract()
+    finally:
+        process.terminate()
+        process.wait()
+        os.unlink(timings_path)
+
+    print_results(results)
+    meta = {'latency': args.latency, 'jitter': args.jitter, 'logins': args.logins,
+            'python': platform.python_version(), 'machine': platform.node()}
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps({'meta': meta, 'results': results}, indent=2) + "\n")
+        print(f"\nBaseline saved to {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path} (run with --save-baseline to create one)")
+        return
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline['meta'] != meta:
+        print(f"\n⚠️  Baseline was taken with {baseline['meta']}, this run is {meta}")
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if not regressions:
+        print(f"\n✅ No regressions against {baseline_path} (tolerance {args.tolerance:.0%})")
+        return
+    print(f"\n❌ {len(regressions)} regressions against {baseline_path} (tolerance {args.tolerance:.0%}):")
+    for scenario, metric, old, new, change in regressions:
+        print(f"  {scenario:<20} {metric:<18} {old} -> {new} ({change:+.0f}%)")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Login regression checks
+Runs the engines against an in-process stand-in server (benchmarks/fake_stocko.py)
+and checks behaviour the benchmarks rely on but don't measure directly:
+
+  - prewarm_reuse: connections opened by prewarm() are the ones the login uses
+  - error_page: an HTTP 503 page (no form) fails step 1 cleanly, with its status
+  - replay_auth_code: a recorded login replays for an auth code it wasn't recorded with
+  - failure_metrics: a login failing after step 3 (TOTP page without answers[])
+    is counted under its failure class, not as a success, by both engines
+  - record_redaction: a --record archive written by either engine contains
+    neither the password nor the auth code
+
+Each check prints ✅ or ❌ with the reason; the exit status is 1 if any failed,
+so it can run in CI next to bench_login.py.
+
+Usage:
+  python benchmarks/check_login.py
+  python benchmarks/check_login.py prewarm_reuse
+"""
+import os
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+
+import pyotp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stocko_accounts import Account
+from stocko_auto_login_GJ114_API_V2 import StockoAPILoginV2
+from stocko_async_login import StockoAsyncLogin
+from stocko_forms import SCHEMA_CACHE
+from stocko_log import configure_logging, flush_logging
+from stocko_metrics import METRICS
+from stocko_recorder import RECORDER
+from stocko_timing import TIMINGS_ENV
+from fake_stocko import FakeStockoServer
+from replay_stocko import ReplayServer
+
+
+def make_account(server, user_id='CHK001'):
+    """A fresh account registered with `server`"""
+    account = Account(user_id, user_id, 'check-password', pyotp.random_base32(), '1000')
+    server.add_accounts([account])
+    return account
+
+
+def check_prewarm_reuse():
+    server = FakeStockoServer(seed=1).start()
+    try:
+        os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = server.url
+        engine = StockoAPILoginV2(make_account(server))
+        engine.prewarm(2)
+        assert engine.login(), "login failed"
+        pools = engine.session.get_adapter(server.url).poolmanager.pools
+        opened = [pools[key].num_connections for key in pools.keys()]
+        assert opened == [2], f"expected the 2 pre-warmed connections in one pool, got {opened} per pool"
+    finally:
+        server.stop()
+
+
+def check_error_page():
+    server = FakeStockoServer(error_rate=1.0, seed=1).start()
+    try:
+        os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = server.url
+        engine = StockoAPILoginV2(make_account(server))
+        errors = []
+        engine._notify = lambda *args, **kwargs: errors.append(kwargs.get('error_message'))
+        assert not engine.login(), "login succeeded against a server answering 503"
+        assert errors == ["OAuth challenge failed: HTTP 503"], f"unexpected failure reported: {errors}"
+    finally:
+        server.stop()
+
+
+def check_replay_auth_code():
+    server = FakeStockoServer(seed=1).start()
+    try:
+        os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = server.url
+        account = make_account(server)
+        RECORDER.start()
+        assert StockoAPILoginV2(account).login(), "recorded login failed"
+    finally:
+        RECORDER.enabled = False
+        server.stop()
+
+    replay = ReplayServer(RECORDER.archive()['log']['entries']).start()
+    RECORDER.entries = []
+    try:
+        os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = replay.url
+        account.auth_code = '2000'
+        assert StockoAPILoginV2(account).login(), f"replayed login failed: {replay.stats}"
+        assert replay.stats['not_recorded'] == 0, f"requests missing from the recording: {replay.stats}"
+    finally:
+        replay.stop()
+
+
+def check_failure_metrics():
+    server = FakeStockoServer(seed=1).start()
+    server.twofa_page = server.twofa_page.replace('name="answers[]"', 'name="answer"')
+    try:
+        os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = server.url
+        account = make_account(server)
+        METRICS.logins.samples.clear()
+        assert not StockoAPILoginV2(account).login(), "sync login succeeded without a TOTP field"
+        assert not asyncio.run(StockoAsyncLogin(account).login()), "async login succeeded without a TOTP field"
+        results = {dict(key)['engine']: dict(key)['result'] for key in METRICS.logins.samples}
+        assert results == {'sync': 'twofa_form', 'async': 'twofa_form'}, f"logins counted as {results}"
+    finally:
+        server.stop()
+
+
+def check_record_redaction():
+    server = FakeStockoServer(seed=1).start()
+    fd, path = tempfile.mkstemp(suffix='.har.json')
+    os.close(fd)
+    try:
+        os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = server.url
+        account = make_account(server)
+        account.auth_code = 'AUTHSECRET123'
+        RECORDER.start()
+        assert StockoAPILoginV2(account).login(), "sync login failed"
+        assert asyncio.run(StockoAsyncLogin(account).login()), "async login failed"
+        RECORDER.save(path)
+        archive = Path(path).read_text(encoding='utf-8')
+        assert '/auth/' in archive, "nothing recorded"
+        leaked = [name for name, secret in (('password', account.password), ('auth code', account.auth_code))
+                  if secret in archive]
+        assert not leaked, f"archive contains the {' and the '.join(leaked)}"
+    finally:
+        RECORDER.enabled = False
+        RECORDER.entries = []
+        os.unlink(path)
+        server.stop()
+
+
+CHECKS = {
+    'prewarm_reuse': check_prewarm_reuse,
+    'error_page': check_error_page,
+    'replay_auth_code': check_replay_auth_code,
+    'failure_metrics': check_failure_metrics,
+    'record_redaction': check_record_redaction,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(CHECKS)
+    unknown = [name for name in names if name not in CHECKS]
+    if unknown:
+        print(f"ERROR: unknown check(s): {', '.join(unknown)} (available: {', '.join(CHECKS)})")
+        sys.exit(1)
+    configure_logging(level='CRITICAL')
+    SCHEMA_CACHE.cache_path = None  # don't overwrite the real pages' learned schema
+    os.environ[TIMINGS_ENV] = os.devnull
+
+    failed = 0
+    for name in names:
+        try:
+            CHECKS[name]()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+        flush_logging(restart=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
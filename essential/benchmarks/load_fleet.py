@@ -0,0 +1,274 @@
+"""
+Fleet-scale load generator
+Synthesizes N accounts (random credentials and TOTP secrets), registers them
+with the stand-in server (benchmarks/fake_stocko.py, in a subprocess) and
+drives the batch runner's login path at a target arrival rate: logins arrive
+open-loop, one every 1/rate seconds (or Poisson with --poisson), whether or
+not earlier ones have finished, and queue for a worker / in-flight slot like
+they would in a real fleet run. The rate steps up until the runner can't keep
+up, reporting for each step:
+
+  offered rate, achieved throughput, error rate, p50/p95/p99 latency from
+  arrival (queueing included), peak logins in flight, runner and server CPU
+
+A step is saturated when throughput falls below 95% of the offered rate, more
+than --max-error-rate of logins fail or p99 exceeds --slo; by default the
+ramp stops there. If the server's CPU is near 100% the server, not the
+runner, was the limit - run it elsewhere (--server-url) to push further.
+
+Usage:
+  python benchmarks/load_fleet.py                                   (async engine, 2000 accounts)
+  python benchmarks/load_fleet.py --engine sync --workers 64 --rates 5 10 20 40
+  python benchmarks/load_fleet.py --rates 50 100 200 400 --duration 30 --latency 0.2 --poisson
+  python benchmarks/load_fleet.py --error-rate 0.01 --keep-going --json fleet.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stocko_batch_login import login_account
+from stocko_async_login import login_account as login_account_async
+from stocko_forms import SCHEMA_CACHE
+from stocko_log import configure_logging
+from stocko_timing import TIMINGS_ENV
+from stocko_totp import ClockSkew
+from stocko_transport import create_shared_adapter, create_shared_connector
+from bench_login import SERVER_PORT, make_accounts, percentile, start_server
+
+DEFAULT_ACCOUNTS = 2000
+DEFAULT_RATES = (5, 10, 20, 50, 100, 200)
+DEFAULT_DURATION = 15
+DEFAULT_WORKERS = 200
+DEFAULT_LATENCY = 0.1
+DEFAULT_SLO = 10.0
+MIN_THROUGHPUT_RATIO = 0.95
+
+
+def process_cpu_seconds(pid):
+    """user + system CPU seconds of a process (Linux /proc), None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class StepStats:
+    """Arrival, completion and in-flight bookkeeping for one rate step"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.first_done = None
+        self.last_done = None
+        self._lock = threading.Lock()
+
+    def arrived(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self, arrival, success):
+        done = time.perf_counter()
+        with self._lock:
+            self.in_flight -= 1
+            self.first_done = self.first_done or done
+            self.last_done = done
+            if success:
+                self.latencies.append(done - arrival)
+            else:
+                self.errors += 1
+
+
+def arrival_times(rate, duration, poisson, rng):
+    """Offsets (s) from the step start at which logins arrive"""
+    if not poisson:
+        return [i / rate for i in range(round(rate * duration))]
+    times = []
+    t = rng.expovariate(rate)
+    while t < duration:
+        times.append(t)
+        t += rng.expovariate(rate)
+    return times
+
+
+def run_step_sync(accounts, offsets, workers, stats):
+    clock = ClockSkew(cache_path=None)
+    adapter = create_shared_adapter(workers)
+
+    def login(account, arrival):
+        try:
+            success = login_account(account, clock, adapter)['success']
+        except Exception:
+            success = False
+        stats.finished(arrival, success)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet-login") as pool:
+        for offset in offsets:
+            time.sleep(max(0.0, start + offset - time.perf_counter()))
+            stats.arrived()
+            pool.submit(login, next(accounts), time.perf_counter())
+    return start
+
+
+async def run_step_async(accounts, offsets, workers, stats):
+    clock = ClockSkew(cache_path=None)
+    semaphore = asyncio.Semaphore(workers)
+    connector = create_shared_connector(workers)
+
+    async def login(account, arrival):
+        try:
+            success = (await login_account_async(account, semaphore, connector, clock))['success']
+        except Exception:
+            success = False
+        stats.finished(arrival, success)
+
+    start = time.perf_counter()
+    tasks = []
+    for offset in offsets:
+        await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+        stats.arrived()
+        tasks.append(asyncio.create_task(login(next(accounts), time.perf_counter())))
+    await asyncio.gather(*tasks)
+    await connector.close()
+    return start
+
+
+def run_step(engine, rate, args, accounts, server_pid, rng):
+    """Drive one arrival rate for args.duration seconds; returns its report row"""
+    offsets = arrival_times(rate, args.duration, args.poisson, rng)
+    stats = StepStats()
+    cpu_start = time.process_time()
+    server_cpu_start = process_cpu_seconds(server_pid) if server_pid else None
+    if engine == 'sync':
+        start = run_step_sync(accounts, offsets, args.workers, stats)
+    else:
+        start = asyncio.run(run_step_async(accounts, offsets, args.workers, stats))
+    wall = (stats.last_done or time.perf_counter()) - start
+    # completion rate between the first and the last completion: equals the arrival rate while the
+    # runner keeps up, without the first login's latency diluting it
+    span = (stats.last_done - stats.first_done) if stats.last_done else 0
+    cpu = time.process_time() - cpu_start
+    server_cpu = process_cpu_seconds(server_pid) if server_pid else None
+
+    sent = len(offsets)
+    ok = len(stats.latencies)
+    row = {
+        'rate': rate,
+        'sent': sent,
+        'ok': ok,
+        'error_rate': round(stats.errors / sent, 4) if sent else 0.0,
+        'throughput_per_s': round((ok - 1) / span, 2) if ok > 1 and span > 0 else 0.0,
+        'p50_s': percentile(stats.latencies, 50),
+        'p95_s': percentile(stats.latencies, 95),
+        'p99_s': percentile(stats.latencies, 99),
+        'peak_in_flight': stats.peak_in_flight,
+        'cpu_pct': round(cpu / wall * 100, 1) if wall > 0 else None,
+        'server_cpu_pct': (round((server_cpu - server_cpu_start) / wall * 100, 1)
+                           if server_cpu is not None and server_cpu_start is not None and wall > 0 else None),
+    }
+    offered = sent / args.duration if args.duration else rate
+    row['saturated'] = bool(
+        row['throughput_per_s'] < offered * MIN_THROUGHPUT_RATIO
+        or row['error_rate'] > args.max_error_rate
+        or (row['p99_s'] or 0) > args.slo
+    )
+    return row
+
+
+def _fmt(value, scale=1, digits=0):
+    return '-' if value is None else f"{value * scale:.{digits}f}"
+
+
+def print_row(row):
+    print(f"{row['rate']:>7} {row['sent']:>6} {row['ok']:>6} {_fmt(row['error_rate'], 100, 1):>6} "
+          f"{_fmt(row['throughput_per_s'], 1, 1):>8} {_fmt(row['p50_s'], 1000):>8} {_fmt(row['p95_s'], 1000):>8} "
+          f"{_fmt(row['p99_s'], 1000):>8} {row['peak_in_flight']:>9} {_fmt(row['cpu_pct'], 1, 0):>6} "
+          f"{_fmt(row['server_cpu_pct'], 1, 0):>7}  {'❌ saturated' if row['saturated'] else '✅'}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Drive the login runner at increasing arrival rates")
+    parser.add_argument('--engine', choices=('async', 'sync'), default='async')
+    parser.add_argument('--accounts', type=int, default=DEFAULT_ACCOUNTS, help="synthetic accounts to cycle through")
+    parser.add_argument('--rates', nargs='+', type=float, default=list(DEFAULT_RATES), help="logins/s per step")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="seconds per step")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="worker threads (sync) or logins in flight (async)")
+    parser.add_argument('--poisson', action='store_true', help="Poisson arrivals instead of evenly spaced")
+    parser.add_argument('--slo', type=float, default=DEFAULT_SLO, help="p99 latency limit (s)")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--keep-going', action='store_true', help="run every step, even past saturation")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help="server latency per response (s)")
+    parser.add_argument('--jitter', type=float, default=DEFAULT_LATENCY / 4)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="server-side injected HTTP 503 rate")
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--server-url', help="use an already running fake_stocko.py instead of starting one")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help="also write the report rows as JSON")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    configure_logging(level='CRITICAL')  # failed logins are counted in the table
+    SCHEMA_CACHE.cache_path = None  # don't overwrite the real pages' learned schema
+    os.environ[TIMINGS_ENV] = os.devnull
+    rng = random.Random(args.seed)
+
+    process = None
+    if args.server_url:
+        url = args.server_url.rstrip('/')
+    else:
+        process, url = start_server(args.port, args.latency, args.jitter, args.error_rate)
+    os.environ['STOCKO_BASE_URL'] = os.environ['STOCKO_API_URL'] = url
+
+    rows = []
+    try:
+        print(f"Registering {args.accounts} synthetic accounts with {url}...")
+        fleet = make_accounts(url, args.accounts, notify=False)
+        accounts = itertools.cycle(fleet)
+        print(f"{args.engine} engine, {args.workers} {'workers' if args.engine == 'sync' else 'in flight'}, "
+              f"{args.duration:g}s per step, server latency {args.latency:g}s/response\n")
+        print(f"{'Rate/s':>7} {'Sent':>6} {'OK':>6} {'Err%':>6} {'Thru/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'In flight':>9} {'CPU%':>6} {'Srv CPU%':>7}")
+        for rate in args.rates:
+            row = run_step(args.engine, rate, args, accounts, process.pid if process else None, rng)
+            rows.append(row)
+            print_row(row)
+            if row['saturated'] and not args.keep_going:
+                break
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    sustained = [row['rate'] for row in rows if not row['saturated']]
+    if sustained:
+        print(f"\nSustained up to {max(sustained):g} logins/s with one {args.engine} runner process")
+    else:
+        print(f"\nSaturated already at {rows[0]['rate']:g} logins/s" if rows else "")
+    last = rows[-1] if rows else None
+    if last and last['saturated'] and (last['server_cpu_pct'] or 0) > 90:
+        print("⚠️  The stand-in server was CPU-bound in the last step - it may have been the limit, not the runner")
+    if args.json:
+        Path(args.json).write_text(json.dumps({'args': vars(args), 'steps': rows}, indent=2) + "\n")
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
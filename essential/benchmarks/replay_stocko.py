@@ -0,0 +1,187 @@
+"""
+Replay server for recorded login traffic
+Serves the responses of a --record archive (stocko_recorder) back to the
+login engines, so a change can be measured offline against real page sizes,
+redirect chains and (optionally) the recorded per-step latencies.
+
+Each recorded login (an account's hops from one GET /auth/... to the next)
+is a script. Every login that hits /auth/{code} gets the next script, round
+robin, and its own session cookie; its following requests are answered with
+the script's next recorded hop for the same method and path (the recorded
+auth codes are redacted, so the /auth/ hop matches whatever the code;
+anything else gets a 404). Absolute
+redirects to the real hosts are rewritten to this server, the recorded
+Set-Cookie headers (values redacted anyway) are dropped. Nothing is
+checked - a wrong TOTP gets the recorded success page - so this measures
+the client, not the flow.
+
+Usage:
+  python benchmarks/replay_stocko.py run.har.json.gz                       (as fast as possible)
+  python benchmarks/replay_stocko.py run.har.json.gz --timing recorded     (recorded server latency)
+  python benchmarks/replay_stocko.py run.har.json.gz --timing recorded --time-scale 0.5
+  STOCKO_BASE_URL=http://localhost:8766 STOCKO_API_URL=http://localhost:8766 \\
+      python stocko_batch_login.py --registry accounts.json
+
+In-process:
+  server = ReplayServer(load_archive('run.har.json.gz'), timing='recorded').start()
+"""
+import sys
+import asyncio
+import secrets
+import argparse
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stocko_recorder import load_archive
+from fake_stocko import BackgroundServer
+
+DEFAULT_PORT = 8766
+SESSION_COOKIE = 'replay_session'
+TIMING_MODES = ('none', 'recorded')
+# Not replayed: framing (aiohttp sets its own), the recorded cookies and the recorded Date
+SKIP_HEADERS = {'content-length', 'content-encoding', 'transfer-encoding', 'connection', 'keep-alive',
+                'set-cookie', 'date', 'server'}
+
+
+def split_logins(entries):
+    """Recorded hops grouped into one list per login (split at each GET /auth/...)"""
+    logins = []
+    current = {}
+    for entry in entries:
+        account = entry.get('_account')
+        request = entry['request']
+        if (request['method'] == 'GET' and _is_auth(urlsplit(request['url']).path)) \
+                or account not in current:
+            current[account] = []
+            logins.append(current[account])
+        current[account].append(entry)
+    return logins
+
+
+def _is_auth(path):
+    return path.startswith('/auth/')
+
+
+def local_url(url):
+    """Recorded absolute URL -> path?query on this server"""
+    parts = urlsplit(url)
+    return urlunsplit(('', '', parts.path or '/', parts.query, '')) if parts.netloc else url
+
+
+def _charset(content_type):
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'charset' and value:
+            return value.strip('"')
+    return 'utf-8'
+
+
+class ReplayServer(BackgroundServer):
+    """Answers each login with the next recorded hop of the script assigned to it"""
+
+    thread_name = "replay-stocko"
+
+    def __init__(self, entries, host='localhost', port=0, timing='none', time_scale=1.0):
+        super().__init__(host, port)
+        self.scripts = [login for login in split_logins(entries) if login]
+        if not self.scripts:
+            raise ValueError("No recorded logins in the archive")
+        self.timing = timing
+        self.time_scale = time_scale
+        self.sessions = {}  # session cookie -> [script, index of the next hop]
+        self.assigned = 0
+        self.stats = dict.fromkeys(('requests', 'logins', 'replayed', 'not_recorded'), 0)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/_admin/stats', self.admin_stats)
+        app.router.add_route('*', '/{tail:.*}', self.replay)
+        return app
+
+    def _next_hop(self, session, method, path):
+        """The script's next hop for this method and path (skipping hops the client didn't make)"""
+        script, index = session
+        for i in range(index, len(script)):
+            request = script[i]['request']
+            recorded = urlsplit(request['url']).path
+            if request['method'] == method and (recorded == path or _is_auth(recorded) and _is_auth(path)):
+                session[1] = i + 1
+                return script[i]
+        return None
+
+    async def replay(self, request):
+        self.stats['requests'] += 1
+        session_id = request.cookies.get(SESSION_COOKIE)
+        new_session = request.method == 'GET' and _is_auth(request.path)
+        if new_session:
+            session_id = secrets.token_urlsafe(16)
+            self.sessions[session_id] = [self.scripts[self.assigned % len(self.scripts)], 0]
+            self.assigned += 1
+            self.stats['logins'] += 1
+        if request.can_read_body:
+            await request.read()
+
+        session = self.sessions.get(session_id)
+        entry = self._next_hop(session, request.method, request.path) if session else None
+        if entry is None:
+            self.stats['not_recorded'] += 1
+            return web.Response(status=404, text=f"{request.method} {request.path} is not in the recording")
+        self.stats['replayed'] += 1
+
+        if self.timing == 'recorded':
+            timings = entry.get('timings') or {}
+            delay = ((timings.get('wait') or 0) + (timings.get('receive') or 0)) / 1000 * self.time_scale
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        recorded = entry['response']
+        headers = {}
+        for header in recorded['headers']:
+            name = header['name']
+            if name.lower() in SKIP_HEADERS:
+                continue
+            headers[name] = local_url(header['value']) if name.lower() == 'location' else header['value']
+        content = recorded.get('content') or {}
+        body = (content.get('text') or '').encode(_charset(content.get('mimeType', '')), errors='replace')
+        response = web.Response(status=recorded['status'], headers=headers, body=body)
+        if new_session:
+            response.set_cookie(SESSION_COOKIE, session_id, httponly=True)
+        script, index = session
+        if index >= len(script):
+            del self.sessions[session_id]  # login finished
+        return response
+
+    async def admin_stats(self, request):
+        return web.json_response(dict(self.stats, scripts=len(self.scripts), open_sessions=len(self.sessions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Stocko login traffic")
+    parser.add_argument('archive', help="archive written by --record (.json or .json.gz)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--timing', choices=TIMING_MODES, default='none',
+                        help="'recorded' holds each response for its recorded wait + receive time")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="multiplier for recorded timings")
+    args = parser.parse_args()
+    try:
+        server = ReplayServer(load_archive(args.archive), args.host, args.port, args.timing, args.time_scale)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    server.start()
+    print(f"Replaying {len(server.scripts)} recorded logins on {server.url} (timing: {args.timing})")
+    print(f"  STOCKO_BASE_URL={server.url} STOCKO_API_URL={server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Stocko account credentials
+One explicit object per account, so many accounts can share one interpreter
+
+Each account is read from '<USER_ID>_*' variables (GitHub Secrets naming),
+optionally backed by a local .env.<USER_ID> file. Nothing is written back to
+os.environ, so accounts never clobber or inherit each other's settings.
+
+For fleets, all accounts live in one JSON registry (see accounts.example.json)
+that is parsed and validated once by load_registry().
+"""
+import os
+import json
+from pathlib import Path
+from dotenv import dotenv_values
+
+ENV_DIR = Path(__file__).parent
+DEFAULT_TIMEOUT = 30
+
+
+class Account:
+    """Credentials and Telegram target for one Stocko account"""
+
+    def __init__(self, user_id, username=None, password=None, totp_secret=None, auth_code=None,
+                 telegram_bot_token=None, telegram_chat_id=None,
+                 priority=0, timeout=DEFAULT_TIMEOUT, enabled=True):
+        self.user_id = user_id
+        self.username = username
+        self.password = password
+        self.totp_secret = totp_secret
+        self.auth_code = auth_code
+        self.telegram_bot_token = telegram_bot_token
+        self.telegram_chat_id = telegram_chat_id
+        # Per-account policy (registry): higher priority logs in first
+        self.priority = priority
+        self.timeout = timeout
+        self.enabled = enabled
+
+    def __repr__(self):
+        # Never print secrets
+        return f"Account({self.user_id!r}, username={self.username!r})"
+
+    @classmethod
+    def from_env(cls, user_id, environ=None):
+        """Build from '<USER_ID>_<KEY>' variables (e.g. GJ114_USERNAME, PP450_PASSWORD)"""
+        environ = os.environ if environ is None else environ
+
+        def get(key):
+            return environ.get(f"{user_id}_{key}") or None
+
+        return cls(
+            user_id,
+            username=get('USERNAME'),
+            password=get('PASSWORD'),
+            totp_secret=get('TOTP_SECRET'),
+            auth_code=get('AUTH_CODE'),
+            telegram_bot_token=environ.get('TELEGRAM_BOT_TOKEN') or None,
+            telegram_chat_id=environ.get('TELEGRAM_CHAT_ID') or None,
+        )
+
+    @classmethod
+    def from_dotenv(cls, user_id, env_dir=ENV_DIR):
+        """Build from .env.<USER_ID> (local development) with process env taking precedence"""
+        dotenv_path = Path(env_dir) / f'.env.{user_id}'
+        environ = {}
+        if dotenv_path.exists():
+            environ.update({k: v for k, v in dotenv_values(dotenv_path).items() if v is not None})
+        environ.update(os.environ)
+        return cls.from_env(user_id, environ)
+
+    def missing(self):
+        """Names of required credentials that are not set"""
+        required = ('USERNAME', 'PASSWORD', 'TOTP_SECRET', 'AUTH_CODE')
+        return [key for key in required if not getattr(self, key.lower())]
+
+
+# Registry keys per account; credentials fall back to '<USER_ID>_*' env vars
+REGISTRY_FIELDS = {
+    'user_id': str,
+    'username': str,
+    'password': str,
+    'totp_secret': str,
+    'auth_code': (str, int),
+    'priority': int,
+    'timeout': (int, float),
+    'enabled': bool,
+}
+
+
+def load_registry(path, environ=None):
+    """Parse and validate an account registry file once, returning Accounts by priority
+
+    Raises ValueError listing every problem found, so a bad registry fails
+    before any login starts.
+    """
+    environ = os.environ if environ is None else environ
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        data = {'accounts': data}
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid account registry {path}: expected an object or a list, got {type(data).__name__}")
+    for key, kind, expected in (('accounts', list, 'a list'), ('defaults', dict, 'an object'),
+                                ('telegram', dict, 'an object')):
+        if not isinstance(data.get(key, kind()), kind):
+            raise ValueError(f"Invalid account registry {path}: '{key}' must be {expected}")
+    defaults = data.get('defaults', {})
+    telegram = data.get('telegram', {})
+    bot_token = telegram.get('bot_token') or environ.get('TELEGRAM_BOT_TOKEN') or None
+    chat_id = telegram.get('chat_id') or environ.get('TELEGRAM_CHAT_ID') or None
+
+    accounts = []
+    errors = []
+    seen = set()
+    for index, entry in enumerate(data.get('accounts', [])):
+        where = f"accounts[{index}]"
+        if not isinstance(entry, dict):
+            errors.append(f"{where}: expected an object")
+            continue
+        entry = {**defaults, **entry}
+
+        unknown = set(entry) - set(REGISTRY_FIELDS)
+        if unknown:
+            errors.append(f"{where}: unknown keys {sorted(unknown)}")
+        for key, kind in REGISTRY_FIELDS.items():
+            value = entry.get(key)
+            # bool is an int subclass - don't let enabled=1, priority=True or timeout=true slip through
+            if value is not None and (not isinstance(value, kind) or (kind is not bool and isinstance(value, bool))):
+                errors.append(f"{where}: '{key}' has wrong type {type(value).__name__}")
+
+        user_id = entry.get('user_id')
+        if not user_id:
+            errors.append(f"{where}: 'user_id' is required")
+            continue
+        if user_id in seen:
+            errors.append(f"{where}: duplicate user_id {user_id!r}")
+        seen.add(user_id)
+
+        account = Account.from_env(user_id, environ)
+        for key in ('username', 'password', 'totp_secret', 'auth_code'):
+            if entry.get(key) is not None:
+                setattr(account, key, str(entry[key]))
+        account.telegram_bot_token = bot_token
+        account.telegram_chat_id = chat_id
+        account.priority = entry.get('priority', 0)
+        account.timeout = entry.get('timeout', DEFAULT_TIMEOUT)
+        account.enabled = entry.get('enabled', True)
+
+        if account.enabled and account.missing():
+            errors.append(f"{where} ({user_id}): missing {', '.join(account.missing())}")
+        if isinstance(account.timeout, (int, float)) and account.timeout <= 0:
+            errors.append(f"{where} ({user_id}): 'timeout' must be positive")
+        accounts.append(account)
+
+    if errors:
+        raise ValueError(f"Invalid account registry {path}:\n  " + "\n  ".join(errors))
+
+    accounts.sort(key=lambda a: a.priority, reverse=True)
+    return accounts
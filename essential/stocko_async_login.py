@@ -0,0 +1,561 @@
+"""
+Stocko Broker Auto Login - asyncio Version
+Same OAuth flow as stocko_auto_login_GJ114_API_V2.py, driven by one event loop
+
+Usage:
+  Local:     python stocko_async_login.py GJ114 PP450 RR1001
+  Registry:  python stocko_async_login.py --registry accounts.json [USER_ID ...]
+  Two-phase: python stocko_async_login.py --two-phase --commit-at 03:45:00 GJ114 PP450
+  GitHub:    Set BATCH_USER_IDS=GJ114,PP450,RR1001 (plus '<USER_ID>_*' secrets)
+
+Optional:
+  ASYNC_MAX_INFLIGHT - logins in flight at once (default 200)
+  STOCKO_REGISTRY    - registry file, same as --registry
+  TELEGRAM_DIGEST    - 'on' or 'failures', same as --digest
+  TELEGRAM_STATUS_BOARD=1 - same as --status-board
+  STOCKO_METRICS_PORT / STOCKO_METRICS_FILE - same as --metrics-port / --metrics-file
+"""
+import os
+import sys
+import time
+import codecs
+import asyncio
+import aiohttp
+from urllib.parse import urlencode, urlsplit
+
+from stocko_engine import BROWSER_HEADERS, StockoLoginBase, send_telegram_notification
+from stocko_notify import NOTIFIER, send_digest
+from stocko_log import configure_logging, get_logger
+from stocko_recorder import RECORDER
+from stocko_timing import StepTimer
+from stocko_metrics import METRICS
+from stocko_cli import (
+    build_arg_parser,
+    new_result,
+    parse_commit_at,
+    print_results,
+    resolve_accounts,
+    start_status_board,
+)
+from stocko_totp import ClockSkew, plan_totp_retry, step_index
+from stocko_forms import StreamingFormReader
+from stocko_responses import (
+    BAD_CREDENTIALS,
+    BAD_TOTP,
+    MIN_BODY_SIZE,
+    SUCCESS,
+    TWOFA_FORM,
+    UNEXPECTED,
+    classify_login_response,
+    classify_totp_response,
+)
+from stocko_transport import (
+    PREWARM_MAX_CONNECTIONS,
+    STREAM_CHUNK_SIZE,
+    create_shared_connector,
+    finish_stream_async,
+    prewarm_connector,
+)
+
+TAG = "ASYNC"
+log = get_logger(TAG)
+DEFAULT_MAX_INFLIGHT = 200
+
+
+class AsyncResponse:
+    """Body, status and final URL of a read aiohttp response
+
+    Like requests.Response, `content` is the raw body and `text` is only
+    decoded when something asks for it.
+    """
+
+    def __init__(self, status_code, url, content=b'', text=None, charset=None):
+        self.status_code = status_code
+        self.url = url
+        self.content = content
+        self.charset = charset or 'utf-8'
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            try:
+                self._text = self.content.decode(self.charset, errors='replace')
+            except LookupError:
+                self._text = self.content.decode('utf-8', errors='replace')
+        return self._text
+
+
+class StockoAsyncLogin(StockoLoginBase):
+    """asyncio engine - same flow as StockoAPILoginV2 on aiohttp, one ClientSession per login"""
+
+    def __init__(self, account, connector=None, clock=None):
+        super().__init__(account, clock, engine='ASYNC')
+        self.session = None
+        # Shared connector (optional); cookies always stay per login
+        self.connector = connector
+
+    async def prewarm(self, connections=1):
+        """Resolve both hosts and open keep-alive connections in the shared connector"""
+        if self.connector is None:
+            return {}
+        return await prewarm_connector(self.connector, (self.base_url, self.api_url), connections)
+
+    async def _request(self, method, url, data=None, form_page=False):
+        """Send a request and read the body (only up to the first </form> if form_page)"""
+        sent_at = time.time()
+        async with self.session.request(method, url, data=data, allow_redirects=True) as resp:
+            date_header = resp.headers.get('Date')
+            if date_header and resp.url.host == urlsplit(self.api_url).hostname:
+                self.clock.record(date_header, sent_at, time.time())
+            if RECORDER.enabled:
+                return await self._record_response(resp, method, data, sent_at)
+            if form_page:
+                return AsyncResponse(resp.status, str(resp.url), text=await self._read_form_page(resp))
+            return AsyncResponse(resp.status, str(resp.url), await resp.read(), charset=resp.charset)
+
+    async def _record_response(self, resp, method, data, sent_at):
+        """Read the whole body and hand every hop to the traffic recorder
+
+        aiohttp only times the whole redirect chain, so the wait is put on the
+        final hop and the redirects are recorded without timings.
+        """
+        wait = time.time() - sent_at
+        read_start = time.perf_counter()
+        body = await resp.read()
+        receive = time.perf_counter() - read_start
+        request_body = urlencode(data) if data else None
+        for hop in resp.history:
+            RECORDER.record(
+                self.user_id, hop.method, str(hop.url), hop.request_info.headers.items(), request_body,
+                hop.status, hop.headers.items(), b'', sent_at, None, None,
+                mime_type=hop.headers.get('Content-Type', ''), redirect_url=hop.headers.get('Location', ''))
+            method, request_body = 'GET', None
+        RECORDER.record(
+            self.user_id, method, str(resp.url), resp.request_info.headers.items(), request_body,
+            resp.status, resp.headers.items(), body, sent_at, wait, receive,
+            mime_type=resp.headers.get('Content-Type', ''), charset=resp.charset)
+        return AsyncResponse(resp.status, str(resp.url), body, charset=resp.charset)
+
+    async def _read_form_page(self, resp):
+        """Streamed equivalent of StockoAPILoginV2.read_form_page()"""
+        try:
+            decoder = codecs.getincrementaldecoder(resp.charset or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        reader = StreamingFormReader()
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if reader.feed(decoder.decode(chunk)):
+                break
+        else:
+            reader.feed(decoder.decode(b'', final=True))
+        await finish_stream_async(resp)
+        return reader.text
+
+    async def _notify(self, *args, **kwargs):
+        """Queue a Telegram notification (sent by the background notifier, never blocks the loop)"""
+        with self._step('notify', network=False):
+            send_telegram_notification(*args, **kwargs)
+
+    async def submit_totp_with_retry(self, totp_url, totp_form_fields, username, auth_code, max_retries=1):
+        """Submit TOTP with retry logic (retry timed to the next TOTP window)"""
+        self.last_totp_code = None  # Store last TOTP code
+        self.last_outcome = None
+        tried_steps = set()
+        code_time = None
+        for attempt in range(max_retries + 1):
+            try:
+                if attempt > 0:
+                    self.log.info(f"⏳ TOTP Retry {attempt}/{max_retries}")
+                    delay, code_time = plan_totp_retry(code_time, tried_steps, now=self.clock.now())
+                    if delay > 0:
+                        self.log.info(f"Waiting {delay:.1f}s for next TOTP window...")
+                        await asyncio.sleep(delay)
+                    else:
+                        self.log.debug("Retrying now with adjacent TOTP window")
+                else:
+                    code_time = self.clock.now()
+
+                self.log.info(f"STEP 5: Submitting TOTP (Attempt {attempt + 1}/{max_retries + 1})...")
+
+                totp_code = self.get_totp_code(code_time)
+                tried_steps.add(step_index(code_time))
+                self.last_totp_code = totp_code
+                totp_data = totp_form_fields.copy()
+                totp_data['answers[]'] = totp_code
+
+                with self._step('totp_post'):
+                    totp_response = await self._request('POST', totp_url, data=totp_data)
+
+                self.log.debug("POST", fields={'url': totp_url, 'status': totp_response.status_code,
+                                               'final_url': totp_response.url})
+
+                if totp_response.status_code >= 400:
+                    error_msg = f"HTTP {totp_response.status_code}: {totp_response.text[:100]}"
+                    self.log.warning(f"⚠️  TOTP request failed: {totp_response.status_code}")
+                    if attempt < max_retries:
+                        continue
+                    self.log.error("❌ Max retries exhausted")
+                    await self._notify(self.tag, self.account, auth_code, success=False, totp_code=totp_code, error_message=error_msg)
+                    return None
+
+                with self._step('verify', network=False):
+                    self.last_outcome = classify_totp_response(totp_response.url, totp_response.content)
+                if self.last_outcome == BAD_TOTP:
+                    error_msg = "Invalid TOTP code - server rejected"
+                    self.log.warning("⚠️  TOTP invalid error detected")
+                    if attempt < max_retries:
+                        continue
+                    self.log.error(f"❌ TOTP failed after {max_retries + 1} attempts")
+                    await self._notify(self.tag, self.account, auth_code, success=False, totp_code=totp_code, error_message=error_msg)
+                    return None
+
+                return totp_response
+
+            except asyncio.TimeoutError:
+                error_msg = f"TOTP request timeout ({self.account.timeout} sec)"
+                self.log.warning("⚠️  TOTP request timeout")
+                if attempt < max_retries:
+                    continue
+                self.log.error(f"❌ Timeout after {max_retries + 1} attempts")
+                await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+                return None
+            except Exception as e:
+                error_msg = f"TOTP error: {str(e)[:100]}"
+                self.log.error(f"❌ TOTP error: {e}")
+                if attempt < max_retries:
+                    continue
+                self.log.error(f"❌ Error after {max_retries + 1} attempts")
+                await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+                return None
+
+        return None
+
+    async def login(self, auth_code=None):
+        """Perform OAuth login - same steps and checks as StockoAPILoginV2.login()"""
+        return await self.prepare(auth_code) and await self.commit()
+
+    async def prepare(self, auth_code=None):
+        """Steps 1-4: run the OAuth flow up to the TOTP page and hold the session there"""
+        if not auth_code:
+            auth_code = self.account.auth_code
+
+        self.start_time = time.time()
+        self.staged = None
+        self.last_outcome = None
+        self.timer = StepTimer(self.user_id, 'async', shared_thread=True)
+
+        # Fresh cookie jar per login so sessions never share state
+        self.session = aiohttp.ClientSession(
+            headers=BROWSER_HEADERS,
+            cookie_jar=aiohttp.CookieJar(),
+            connector=self.connector,
+            connector_owner=self.connector is None,
+            timeout=aiohttp.ClientTimeout(total=self.account.timeout),
+        )
+        try:
+            if await self._prepare(auth_code, self.account.username, self.account.password):
+                return True
+        except Exception as e:
+            await self._report_exception_async(e, auth_code)
+        finally:
+            self.prepare_seconds = time.time() - self.start_time
+        await self.session.close()
+        self.timer.emit(False, self.last_outcome)
+        self.timer = None
+        return False
+
+    async def commit(self):
+        """Steps 5-6: submit the TOTP for a session staged by prepare() and verify success"""
+        if not self.staged:
+            self.log.error("❌ Nothing staged - call prepare() first")
+            return False
+        auth_code = self.staged['auth_code']
+        success = False
+        try:
+            success = await self._commit(auth_code, self.account.username, time.time())
+            return success
+        except Exception as e:
+            await self._report_exception_async(e, auth_code)
+            return False
+        finally:
+            self.staged = None
+            await self.session.close()
+            if self.timer:
+                self.timer.emit(success, self.last_outcome)
+                self.timer = None
+
+    async def _report_exception_async(self, e, auth_code):
+        error_msg = f"Exception: {str(e)[:100]}"
+        self.log.error(f"❌ ERROR: {e}")
+        self.last_outcome = None  # failed on the exception, not on the last classified response
+        try:
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+        except Exception:
+            pass
+
+    async def _prepare(self, auth_code, username, password):
+        # STEP 1: Initial auth endpoint
+        self.log.info("STEP 1: Getting OAuth challenge...")
+        auth_url = f"{self.base_url}/auth/{auth_code}"
+        with self._step('auth_get'):
+            response = await self._request('GET', auth_url, form_page=True)
+        self.log.debug("GET", fields={'url': auth_url, 'status': response.status_code, 'final_url': response.url})
+
+        if response.status_code >= 400:
+            error_msg = f"OAuth challenge failed: HTTP {response.status_code}"
+            self.log.error(f"❌ Initial request failed: {response.status_code}")
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+            return False
+
+        # STEP 2: Extract form fields from login page
+        self.log.info("STEP 2: Extracting form fields...")
+        with self._step('form_extract', network=False):
+            form_fields = self.extract_form_fields(response.text, 'login')
+        if not form_fields:
+            self.log.error("❌ Could not extract form fields")
+            return False
+
+        # STEP 3: Submit login credentials
+        self.log.info("STEP 3: Submitting credentials...")
+        login_data = form_fields.copy()
+        login_data['login_id'] = username
+        login_data['password'] = password
+
+        with self._step('credential_post'):
+            login_response = await self._request('POST', response.url, data=login_data, form_page=True)
+        self.log.debug("POST", fields={'url': response.url, 'status': login_response.status_code,
+                                       'final_url': login_response.url})
+
+        if login_response.status_code >= 400:
+            error_msg = f"HTTP {login_response.status_code}: {login_response.text[:100]}"
+            self.log.error(f"❌ Login request failed: {login_response.status_code}")
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+            return False
+
+        outcome = self.last_outcome = classify_login_response(login_response.url, login_response.text)
+        if outcome == BAD_CREDENTIALS:
+            error_msg = "Invalid credentials - server rejected username/password"
+            self.log.error("❌ Login error detected - credentials rejected!")
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+            return False
+
+        if not login_response.url.startswith(self.api_url + "/oauth/twofa"):
+            self.log.warning(f"⚠️  Unexpected URL after login: {login_response.url}")
+
+        # STEP 4: Get TOTP form
+        self.log.info("STEP 4: Getting TOTP form...")
+        if outcome != SUCCESS:
+            error_msg = f"Not on TOTP page. Got URL: {login_response.url[:80]}..."
+            self.log.error("❌ ERROR: Not on TOTP page!")
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+            return False
+
+        with self._step('twofa_extract', network=False):
+            totp_form_fields = self.extract_form_fields(login_response.text, 'twofa')
+        if not totp_form_fields or 'answers[]' not in totp_form_fields:
+            error_msg = f"TOTP form field not found. Available: {', '.join(list(totp_form_fields.keys())[:5])}"
+            self.log.warning("⚠️  Could not find TOTP input field")
+            self.last_outcome = TWOFA_FORM
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+            return False
+
+        self.staged = {
+            'auth_code': auth_code,
+            'totp_url': login_response.url,
+            'totp_form_fields': totp_form_fields,
+        }
+        self.log.info("✅ Staged at TOTP page")
+        return True
+
+    async def _commit(self, auth_code, username, commit_start):
+        # STEP 5: Generate and submit TOTP (with retry logic)
+        totp_response = await self.submit_totp_with_retry(
+            self.staged['totp_url'],
+            self.staged['totp_form_fields'],
+            username,
+            auth_code,
+            max_retries=1
+        )
+        if not totp_response:
+            return False
+
+        # STEP 6: Verify success
+        self.log.info("STEP 6: Verifying success...")
+        final_url = totp_response.url
+
+        if len(totp_response.content) < MIN_BODY_SIZE:
+            error_msg = "Empty or invalid final response"
+            self.log.error("❌ Response too small or empty")
+            self.last_outcome = UNEXPECTED
+            await self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
+            return False
+
+        if self.last_outcome == SUCCESS:
+            # Active time (prepare + commit), not including a two-phase hold - as in the batch table
+            duration = self.prepare_seconds + time.time() - commit_start
+            self.log.info(f"✓✓✓ LOGIN SUCCESSFUL! ✓✓✓ ({duration:.1f}s)")
+            await self._notify(
+                self.tag, self.account, auth_code,
+                success=True,
+                duration=duration,
+                totp_code=self.last_totp_code,
+                final_url=final_url
+            )
+            return True
+
+        error_msg = f"Login verification failed. Final URL: {final_url[:80]}... - No 'success' indicator found"
+        self.log.error("❌ SUCCESS NOT VERIFIED")
+        self.log.debug(f"Final URL: {final_url}")
+        await self._notify(self.tag, self.account, auth_code, success=False, totp_code=self.last_totp_code, error_message=error_msg)
+        return False
+
+
+async def login_account(account, semaphore, connector, clock=None):
+    """Run one account's login under the in-flight limit and return its result row"""
+    async with semaphore:
+        start_time = time.time()
+        result = new_result(account)
+        if not account.auth_code:
+            result['error'] = f"{account.user_id}_AUTH_CODE not set"
+            return result
+        result['success'] = await StockoAsyncLogin(account, connector, clock).login(account.auth_code)
+        if not result['success']:
+            result['error'] = "Login failed (see log)"
+        result['duration'] = time.time() - start_time
+        return result
+
+
+async def run_batch(accounts, max_inflight=DEFAULT_MAX_INFLIGHT, board=None, clock=None):
+    """Log in all accounts on one event loop, returning results in input order
+
+    A StatusBoard, if given, is updated as each account finishes. Pass a
+    ClockSkew(cache_path=None) to keep the run out of the skew cache.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_inflight))
+    connector = create_shared_connector(max_inflight)
+    clock = clock or ClockSkew()
+
+    async def login_and_report(account):
+        result = await login_account(account, semaphore, connector, clock)
+        if board:
+            board.update(result)
+        return result
+
+    try:
+        if accounts:
+            connections = min(len(accounts), max_inflight, PREWARM_MAX_CONNECTIONS)
+            await StockoAsyncLogin(accounts[0], connector, clock).prewarm(connections)
+        return await asyncio.gather(*(login_and_report(a) for a in accounts))
+    finally:
+        await connector.close()
+        clock.save()
+
+
+async def run_two_phase(accounts, max_inflight=DEFAULT_MAX_INFLIGHT, commit_at=None, board=None):
+    """Stage all accounts at the TOTP page, then commit every TOTP together at `commit_at`"""
+    semaphore = asyncio.Semaphore(max(1, max_inflight))
+    connector = create_shared_connector(max_inflight)
+    clock = ClockSkew()
+    results = {account.user_id: new_result(account) for account in accounts}
+    engines = []
+    for account in accounts:
+        if not account.auth_code:
+            results[account.user_id]['error'] = f"{account.user_id}_AUTH_CODE not set"
+        else:
+            engines.append(StockoAsyncLogin(account, connector, clock))
+
+    async def stage(engine):
+        async with semaphore:
+            start_time = time.time()
+            ok = await engine.prepare(engine.account.auth_code)
+            results[engine.user_id]['duration'] = time.time() - start_time
+            if not ok:
+                results[engine.user_id]['error'] = "Staging failed (see log)"
+            if board:
+                if ok:
+                    board.mark_staged(engine.user_id)
+                else:
+                    board.update(results[engine.user_id])
+            return ok
+
+    async def commit(engine):
+        start_time = time.time()
+        ok = await engine.commit()
+        result = results[engine.user_id]
+        result['success'] = ok
+        result['duration'] += time.time() - start_time
+        if not ok:
+            result['error'] = "TOTP commit failed (see log)"
+        if board:
+            board.update(result)
+        return time.time()
+
+    if board:
+        for result in results.values():
+            if result['error']:
+                board.update(result)
+    try:
+        if engines:
+            await engines[0].prewarm(min(len(engines), max_inflight, PREWARM_MAX_CONNECTIONS))
+        log.info(f"PHASE 1: Staging {len(engines)} accounts at the TOTP page...")
+        staged = await asyncio.gather(*(stage(e) for e in engines))
+        ready = [e for e, ok in zip(engines, staged) if ok]
+        log.info(f"PHASE 1: {len(ready)}/{len(engines)} staged")
+
+        if ready:
+            if commit_at:
+                await asyncio.sleep(max(0.0, commit_at - time.time()))
+            released_at = time.time()
+            log.info(f"PHASE 2: Committing {len(ready)} TOTPs")
+            finished = await asyncio.gather(*(commit(e) for e in ready))
+            log.info(f"PHASE 2: All commits done within {max(finished) - released_at:.2f}s of the trigger")
+    finally:
+        await connector.close()
+        clock.save()
+    return [results[account.user_id] for account in accounts]
+
+
+def main():
+    args = build_arg_parser("Log in many Stocko accounts on one asyncio event loop").parse_args()
+    configure_logging(quiet=args.quiet, verbose=args.verbose)
+    try:
+        accounts = resolve_accounts(args.user_ids, args.registry)
+        commit_at = parse_commit_at(args.commit_at)
+        NOTIFIER.set_digest(args.digest)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if not accounts:
+        print(f"ERROR: No accounts given. Pass USER_IDs, --registry FILE or set BATCH_USER_IDS")
+        sys.exit(1)
+
+    max_inflight = int(os.getenv('ASYNC_MAX_INFLIGHT', DEFAULT_MAX_INFLIGHT))
+    log.info(f"Logging in {len(accounts)} accounts with up to {max_inflight} in flight")
+
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    if args.record:
+        RECORDER.start()
+    board = start_status_board(accounts, args, "Stocko async login")
+    start_time = time.time()
+    if args.two_phase:
+        results = asyncio.run(run_two_phase(accounts, max_inflight, commit_at, board))
+    else:
+        results = asyncio.run(run_batch(accounts, max_inflight, board))
+    wall_time = time.time() - start_time
+    print_results(results, wall_time)
+    if board:
+        board.close()
+    if args.metrics_file:
+        METRICS.write_textfile(args.metrics_file)
+    if args.record:
+        RECORDER.save(args.record)
+    if NOTIFIER.digest:
+        send_digest(accounts, results, wall_time)
+
+    sys.exit(0 if all(r['success'] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,359 +8,339 @@ Usage:
 """
 import os
 import sys
-import json
 import time
+import codecs
 import requests
-from pathlib import Path
-from pyotp import TOTP
-from dotenv import load_dotenv
-from datetime import datetime, timezone, timedelta
-import re
-from bs4 import BeautifulSoup
 
-# Determine which user config to load
-USER_ID = os.getenv('USER_ID', 'GJ114')  # Default to GJ114, can override with env var
+from stocko_accounts import Account
+from stocko_engine import BROWSER_HEADERS, StockoLoginBase, send_telegram_notification
+from stocko_totp import plan_totp_retry, step_index
+from stocko_transport import STREAM_CHUNK_SIZE, finish_stream, prewarm_session
+from stocko_log import get_logger
+from stocko_recorder import RECORDER
+from stocko_timing import StepTimer
+from stocko_forms import StreamingFormReader
+from stocko_responses import (
+    BAD_CREDENTIALS,
+    BAD_TOTP,
+    MIN_BODY_SIZE,
+    SUCCESS,
+    TWOFA_FORM,
+    UNEXPECTED,
+    classify_login_response,
+    classify_totp_response,
+)
+from urllib.parse import urlsplit
 
-# Load environment variables from .env file (local development)
-dotenv_path = Path(__file__).parent / f'.env.{USER_ID}'
-load_dotenv(dotenv_path)
 
-# Define credential variables (simplified - just one format now)
-def get_credential(key):
-    """Get credential from environment using GitHub Secrets naming convention"""
-    # Format: <USER_ID>_<KEY> (e.g., GJ114_USERNAME, PP450_PASSWORD)
-    env_key = f"{USER_ID}_{key}"
-    value = os.getenv(env_key)
-    if value:
-        return value
-    return None
+class StockoAPILoginV2(StockoLoginBase):
+    """requests engine: one Session (cookies, headers) per account, optionally on a shared adapter"""
 
-def send_telegram_notification(tag, username, auth_code, success=True, duration=None, totp_code=None, final_url=None, error_message=None):
-    """Send Telegram notification"""
-    bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-
-    if not bot_token or not chat_id:
-        print(f"[{tag}] Telegram not configured: TELEGRAM_BOT_TOKEN={'set' if bot_token else 'MISSING'}, TELEGRAM_CHAT_ID={'set' if chat_id else 'MISSING'}")
-        return
-
-    ist = timezone(timedelta(hours=5, minutes=30))
-    now_ist = datetime.now(ist)
-    timestamp = now_ist.strftime("%Y-%m-%d %H:%M:%S")
-
-    # Header with username
-    message = f"<b>Token Status for {username}</b>\n"
-
-    # Status line
-    if success:
-        message += f"<b>Status - ✅ Token Generated</b>\n"
-    else:
-        error_text = str(error_message)[:100] if error_message else "Unknown error"
-        message += f"<b>Status - ❌ {error_text}</b>\n"
-
-    # Account details
-    message += f"\n👤 Account: <code>{username}</code>\n"
-    message += f"🔑 Auth: <code>{auth_code}</code>\n"
-    message += f"⏰ Time: <code>{timestamp}</code>\n"
+    def __init__(self, account, clock=None, adapter=None):
+        super().__init__(account, clock, engine='API-V2')
+        self.session = requests.Session()
+        
+        # Set realistic browser headers
+        self.session.headers.update(BROWSER_HEADERS)
+        self.session.hooks['response'].append(self._record_server_time)
+        if RECORDER.enabled:
+            RECORDER.attach(self.session, self.user_id)
 
-    # Additional details only on success
-    if success:
-        if totp_code:
-            message += f"• TOTP: <code>{totp_code}</code>\n"
-        if duration:
-            message += f"• ⏳ Duration: <code>{duration:.1f}s</code>\n"
-        message += f"• 🖥️ Type: <code>API (No Browser)</code>\n"
+        # Shared connection pool across accounts (cookie jar stays per session)
+        if adapter is not None:
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
 
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": message, "parse_mode": "HTML"}
+    def _record_server_time(self, response, *args, **kwargs):
+        """Response hook: feed the TOTP verifier's Date header into the clock skew estimate"""
+        date_header = response.headers.get('Date')
+        if date_header and urlsplit(response.url).netloc == urlsplit(self.api_url).netloc:
+            received_at = time.time()
+            self.clock.record(date_header, received_at - response.elapsed.total_seconds(), received_at)
 
-    try:
-        resp = requests.post(url, json=payload, timeout=10)
-        if resp.status_code != 200:
-            print(f"[{tag}] Telegram send failed: HTTP {resp.status_code} - {resp.text}")
-        else:
-            print(f"[{tag}] Telegram notification sent")
-    except Exception as e:
-        print(f"[{tag}] Telegram exception: {e}")
+    def prewarm(self, connections=1):
+        """Resolve both hosts and open keep-alive connections before the timed flow"""
+        return prewarm_session(self.session, (self.base_url, self.api_url), connections)
 
+    def _notify(self, *args, **kwargs):
+        """Queue a Telegram notification, timed as the 'notify' step"""
+        with self._step('notify', network=False):
+            send_telegram_notification(*args, **kwargs)
 
-class StockoAPILoginV2:
-    def __init__(self):
-        self.base_url = "https://sasstocko.broker.tradetron.tech"
-        self.api_url = "https://api.stocko.in"
-        self.tag = "GJ114-API-V2"
-        self.session = requests.Session()
-        
-        # Set realistic browser headers
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'max-age=0',
-        })
+    def read_form_page(self, response):
+        """Read a streamed response only up to the first </form> and return that text
 
-    def extract_form_fields(self, html):
-        """Extract ALL form fields from HTML using BeautifulSoup"""
+        extract_form_fields() only needs the first form, so the rest of the
+        page is never decoded or kept in memory.
+        """
         try:
-            if not html or not isinstance(html, str):
-                print(f"[{self.tag}] ❌ Invalid HTML content")
-                return {}
-                
-            soup = BeautifulSoup(html, 'html.parser')
-            form = soup.find('form')
-            if not form:
-                print(f"[{self.tag}] ⚠️  No form found in HTML")
-                return {}
-            
-            fields = {}
-            # Extract all input fields
-            for input_field in form.find_all('input'):
-                name = input_field.get('name')
-                value = input_field.get('value', '')
-                if name:
-                    fields[name] = value
-                    display_val = value[:30] if len(str(value)) > 30 else value
-                    print(f"[{self.tag}] Found field: {name}={display_val}")
-            
-            if not fields:
-                print(f"[{self.tag}] ⚠️  No input fields found in form")
-                return {}
-            
-            return fields
-        except Exception as e:
-            print(f"[{self.tag}] ❌ Error extracting form fields: {e}")
-            return {}
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        reader = StreamingFormReader()
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            if reader.feed(decoder.decode(chunk)):
+                finish_stream(response)  # stopped at </form>: drain or drop the rest
+                break
+        else:
+            reader.feed(decoder.decode(b'', final=True))  # no </form>: the whole page was read
+        return reader.text
 
-    def get_totp_code(self):
-        """Generate TOTP code"""
-        try:
-            totp_secret = get_credential('TOTP_SECRET')
-            if not totp_secret:
-                print(f"[{self.tag}] ❌ TOTP_SECRET not set for user {USER_ID}")
-                raise ValueError("TOTP secret missing")
-            code = TOTP(totp_secret).now()
-            print(f"[{self.tag}] Generated TOTP: {code}")
-            return code
-        except Exception as e:
-            print(f"[{self.tag}] ❌ Error generating TOTP: {e}")
-            raise
-    
     def submit_totp_with_retry(self, totp_url, totp_form_fields, username, auth_code, max_retries=1):
-        """Submit TOTP with retry logic (1 retry after 30sec wait)"""
+        """Submit TOTP with retry logic (retry timed to the next TOTP window)"""
         self.last_totp_code = None  # Store last TOTP code
+        self.last_outcome = None
+        tried_steps = set()
+        code_time = None
         for attempt in range(max_retries + 1):
             try:
                 if attempt > 0:
-                    print(f"\n[{self.tag}] ⏳ TOTP Retry {attempt}/{max_retries}")
-                    print(f"[{self.tag}] Waiting 30 seconds before retry...")
-                    time.sleep(30)
+                    self.log.info(f"⏳ TOTP Retry {attempt}/{max_retries}")
+                    delay, code_time = plan_totp_retry(code_time, tried_steps, now=self.clock.now())
+                    if delay > 0:
+                        self.log.info(f"Waiting {delay:.1f}s for next TOTP window...")
+                        time.sleep(delay)
+                    else:
+                        self.log.debug("Retrying now with adjacent TOTP window")
+                else:
+                    code_time = self.clock.now()
                 
-                print(f"\n[{self.tag}] STEP 5: Submitting TOTP (Attempt {attempt + 1}/{max_retries + 1})...")
+                self.log.info(f"STEP 5: Submitting TOTP (Attempt {attempt + 1}/{max_retries + 1})...")
                 
-                totp_code = self.get_totp_code()
+                totp_code = self.get_totp_code(code_time)
+                tried_steps.add(step_index(code_time))
                 self.last_totp_code = totp_code  # Store for later use
                 totp_data = totp_form_fields.copy()
                 totp_data['answers[]'] = totp_code
                 
-                print(f"[{self.tag}] TOTP Form data keys: {list(totp_data.keys())}")
+                self.log.debug(f"TOTP Form data keys: {list(totp_data.keys())}")
                 
-                totp_response = self.session.post(
-                    totp_url,
-                    data=totp_data,
-                    allow_redirects=True,
-                    timeout=30
-                )
+                with self._step('totp_post'):
+                    totp_response = self.session.post(
+                        totp_url,
+                        data=totp_data,
+                        allow_redirects=True,
+                        timeout=self.account.timeout
+                    )
                 
-                print(f"[{self.tag}] POST {totp_url}")
-                print(f"[{self.tag}] Status: {totp_response.status_code}")
-                print(f"[{self.tag}] Final URL: {totp_response.url}")
+                self.log.debug("POST", fields={'url': totp_url, 'status': totp_response.status_code,
+                                               'final_url': totp_response.url})
                 
                 # Validate response
                 if totp_response.status_code >= 400:
                     error_msg = f"HTTP {totp_response.status_code}: {totp_response.text[:100]}"
-                    print(f"[{self.tag}] ⚠️  TOTP request failed: {totp_response.status_code}")
+                    self.log.warning(f"⚠️  TOTP request failed: {totp_response.status_code}")
                     if attempt < max_retries:
-                        print(f"[{self.tag}] Will retry after waiting...")
+                        self.log.debug("Will retry...")
                         continue
                     else:
-                        print(f"[{self.tag}] ❌ Max retries exhausted")
-                        send_telegram_notification(self.tag, username, auth_code, success=False, totp_code=totp_code, error_message=error_msg)
+                        self.log.error("❌ Max retries exhausted")
+                        self._notify(self.tag, self.account, auth_code, success=False, totp_code=totp_code, error_message=error_msg)
                         return None
                 
-                # Check for invalid TOTP
-                if 'invalid' in totp_response.text.lower() or 'incorrect' in totp_response.text.lower():
+                # Check for invalid TOTP (raw bytes, scanned once; step 6 reuses the outcome)
+                with self._step('verify', network=False):
+                    self.last_outcome = classify_totp_response(totp_response.url, totp_response.content)
+                if self.last_outcome == BAD_TOTP:
                     error_msg = "Invalid TOTP code - server rejected"
-                    print(f"[{self.tag}] ⚠️  TOTP invalid error detected")
+                    self.log.warning("⚠️  TOTP invalid error detected")
                     if attempt < max_retries:
-                        print(f"[{self.tag}] Will retry with new TOTP...")
+                        self.log.debug("Will retry with next TOTP...")
                         continue
                     else:
-                        print(f"[{self.tag}] ❌ TOTP failed after {max_retries + 1} attempts")
-                        send_telegram_notification(self.tag, username, auth_code, success=False, totp_code=totp_code, error_message=error_msg)
+                        self.log.error(f"❌ TOTP failed after {max_retries + 1} attempts")
+                        self._notify(self.tag, self.account, auth_code, success=False, totp_code=totp_code, error_message=error_msg)
                         return None
                 
                 # Success - return response
                 return totp_response
                 
             except requests.Timeout:
-                error_msg = "TOTP request timeout (30 sec)"
-                print(f"[{self.tag}] ⚠️  TOTP request timeout")
+                error_msg = f"TOTP request timeout ({self.account.timeout} sec)"
+                self.log.warning("⚠️  TOTP request timeout")
                 if attempt < max_retries:
-                    print(f"[{self.tag}] Will retry...")
+                    self.log.debug("Will retry...")
                     continue
                 else:
-                    print(f"[{self.tag}] ❌ Timeout after {max_retries + 1} attempts")
-                    send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                    self.log.error(f"❌ Timeout after {max_retries + 1} attempts")
+                    self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                     return None
             except Exception as e:
                 error_msg = f"TOTP error: {str(e)[:100]}"
-                print(f"[{self.tag}] ❌ TOTP error: {e}")
+                self.log.error(f"❌ TOTP error: {e}")
                 if attempt < max_retries:
-                    print(f"[{self.tag}] Will retry...")
+                    self.log.debug("Will retry...")
                     continue
                 else:
-                    print(f"[{self.tag}] ❌ Error after {max_retries + 1} attempts")
-                    send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                    self.log.error(f"❌ Error after {max_retries + 1} attempts")
+                    self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                     return None
         
         return None
 
     def login(self, auth_code=None):
         """Perform OAuth login using improved API approach"""
+        return self.prepare(auth_code) and self.commit()
+
+    def prepare(self, auth_code=None):
+        """Steps 1-4: run the OAuth flow up to the TOTP page and hold the session there
+
+        Nothing here depends on the TOTP code, so batch runs can stage every
+        account ahead of time and commit() them together later.
+        """
         
         # Use provided auth_code or get from credentials
         if not auth_code:
-            auth_code = get_credential('AUTH_CODE')
+            auth_code = self.account.auth_code
         
-        start_time = time.time()
-        username = get_credential('USERNAME')
-        password = get_credential('PASSWORD')
-        totp_code = None
+        self.start_time = time.time()
+        self.staged = None
+        self.last_outcome = None
+        self.timer = StepTimer(self.user_id, 'sync')
+        username = self.account.username
+        password = self.account.password
         
         try:
-            print("\n" + "="*70)
-            print(f"[{self.tag}] ═══════════════════════════════════════════════════════════")
-            print(f"[{self.tag}] STOCKO BROKER AUTO LOGIN - IMPROVED API VERSION")
-            print(f"[{self.tag}] ═══════════════════════════════════════════════════════════")
-            print("="*70)
+            self.log.debug("STOCKO BROKER AUTO LOGIN - IMPROVED API VERSION")
             
             # ═══════════════════════════════════════════════════════════
             # STEP 1: Initial auth endpoint
             # ═══════════════════════════════════════════════════════════
-            print(f"\n[{self.tag}] STEP 1: Getting OAuth challenge...")
+            self.log.info("STEP 1: Getting OAuth challenge...")
             auth_url = f"{self.base_url}/auth/{auth_code}"
-            print(f"[{self.tag}] GET {auth_url}")
             
-            response = self.session.get(auth_url, allow_redirects=True, timeout=30)
-            print(f"[{self.tag}] Status: {response.status_code}")
-            print(f"[{self.tag}] Final URL: {response.url}")
-            print(f"[{self.tag}] Cookies: {list(self.session.cookies.keys())}")
+            with self._step('auth_get'):
+                response = self.session.get(auth_url, allow_redirects=True, timeout=self.account.timeout, stream=True)
+                page = self.read_form_page(response)
+            self.log.debug("GET", fields={'url': auth_url, 'status': response.status_code, 'final_url': response.url,
+                                          'cookies': list(self.session.cookies.keys())})
             
             # Validate initial response
             if response.status_code >= 400:
                 error_msg = f"OAuth challenge failed: HTTP {response.status_code}"
-                print(f"[{self.tag}] ❌ Initial request failed: {response.status_code}")
-                send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                self.log.error(f"❌ Initial request failed: {response.status_code}")
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
             # ═══════════════════════════════════════════════════════════
             # STEP 2: Extract form fields from login page
             # ═══════════════════════════════════════════════════════════
-            print(f"\n[{self.tag}] STEP 2: Extracting form fields...")
+            self.log.info("STEP 2: Extracting form fields...")
             
-            form_fields = self.extract_form_fields(response.text)
+            with self._step('form_extract', network=False):
+                form_fields = self.extract_form_fields(page, 'login')
             
             if not form_fields:
-                print(f"[{self.tag}] ❌ Could not extract form fields")
+                self.log.error("❌ Could not extract form fields")
                 return False
             
             # ═══════════════════════════════════════════════════════════
             # STEP 3: Prepare and submit login credentials
             # ═══════════════════════════════════════════════════════════
-            print(f"\n[{self.tag}] STEP 3: Submitting credentials...")
-            print(f"[{self.tag}] Username: {username}")
+            self.log.info("STEP 3: Submitting credentials...")
+            self.log.debug(f"Username: {username}")
             
             # Update form fields with credentials
             login_data = form_fields.copy()
             login_data['login_id'] = username
             login_data['password'] = password
             
-            print(f"[{self.tag}] Form data keys: {list(login_data.keys())}")
+            self.log.debug(f"Form data keys: {list(login_data.keys())}")
             
-            login_response = self.session.post(
-                response.url,
-                data=login_data,
-                allow_redirects=True,
-                timeout=30
-            )
-            print(f"[{self.tag}] POST {response.url}")
-            print(f"[{self.tag}] Status: {login_response.status_code}")
-            print(f"[{self.tag}] Final URL: {login_response.url}")
+            with self._step('credential_post'):
+                login_response = self.session.post(
+                    response.url,
+                    data=login_data,
+                    allow_redirects=True,
+                    timeout=self.account.timeout,
+                    stream=True
+                )
+                login_page = self.read_form_page(login_response)
+            self.log.debug("POST", fields={'url': response.url, 'status': login_response.status_code,
+                                           'final_url': login_response.url})
             
             # Check for errors
             if login_response.status_code >= 400:
-                error_msg = f"HTTP {login_response.status_code}: {login_response.text[:100]}"
-                print(f"[{self.tag}] ❌ Login request failed: {login_response.status_code}")
-                print(f"[{self.tag}] Response: {login_response.text[:200]}")
-                send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                error_msg = f"HTTP {login_response.status_code}: {login_page[:100]}"
+                self.log.error(f"❌ Login request failed: {login_response.status_code}")
+                self.log.debug(f"Response: {login_page[:200]}")
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
-            # Better error detection - look for error page patterns
-            text_lower = login_response.text.lower()
-            if 'invalid credentials' in text_lower or 'login failed' in text_lower or '<error>' in text_lower:
-                print(f"[{self.tag}] ❌ Login error detected in response")
+            # Error page patterns in the body, or redirected back to the login form
+            outcome = self.last_outcome = classify_login_response(login_response.url, login_page)
+            if outcome == BAD_CREDENTIALS:
+                error_msg = "Invalid credentials - server rejected username/password"
+                self.log.error("❌ Login error detected - credentials rejected!")
+                self.log.debug("The server did not redirect to TOTP page")
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
             if login_response.url.startswith(self.api_url + "/oauth/twofa"):
-                print(f"[{self.tag}] ✅ Successfully redirected to TOTP page!")
+                self.log.info("✅ Successfully redirected to TOTP page!")
             else:
-                # Check if still on login page (means credentials failed)
-                if '/oauth/login' in login_response.url:
-                    error_msg = "Invalid credentials - server rejected username/password"
-                    print(f"[{self.tag}] ❌ Still on login page - credentials rejected!")
-                    print(f"[{self.tag}] The server did not redirect to TOTP page")
-                    send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
-                    return False
-                else:
-                    print(f"[{self.tag}] ⚠️  Unexpected URL after login: {login_response.url}")
-                    print(f"[{self.tag}] Expected: {self.api_url}/oauth/twofa")
+                self.log.warning(f"⚠️  Unexpected URL after login: {login_response.url}")
+                self.log.debug(f"Expected: {self.api_url}/oauth/twofa")
 
             # ═══════════════════════════════════════════════════════════
             # STEP 4: Get TOTP form
             # ═══════════════════════════════════════════════════════════
-            print(f"\n[{self.tag}] STEP 4: Getting TOTP form...")
+            self.log.info("STEP 4: Getting TOTP form...")
             
             # Check if we're on TOTP page
-            if 'twofa' not in login_response.url.lower():
+            if outcome != SUCCESS:
                 error_msg = f"Not on TOTP page. Got URL: {login_response.url[:80]}..."
-                print(f"[{self.tag}] ❌ ERROR: Not on TOTP page!")
-                print(f"[{self.tag}] Expected URL containing 'twofa'")
-                print(f"[{self.tag}] Got URL: {login_response.url}")
-                send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                self.log.error("❌ ERROR: Not on TOTP page!")
+                self.log.debug("Expected URL containing 'twofa'")
+                self.log.debug(f"Got URL: {login_response.url}")
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
-            totp_form_fields = self.extract_form_fields(login_response.text)
+            with self._step('twofa_extract', network=False):
+                totp_form_fields = self.extract_form_fields(login_page, 'twofa')
             
             if not totp_form_fields or 'answers[]' not in totp_form_fields:
                 error_msg = f"TOTP form field not found. Available: {', '.join(list(totp_form_fields.keys())[:5])}"
-                print(f"[{self.tag}] ⚠️  Could not find TOTP input field")
-                print(f"[{self.tag}] Available fields: {list(totp_form_fields.keys())}")
-                send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                self.log.warning("⚠️  Could not find TOTP input field")
+                self.last_outcome = TWOFA_FORM
+                self.log.debug(f"Available fields: {list(totp_form_fields.keys())}")
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
+            self.staged = {
+                'auth_code': auth_code,
+                'totp_url': login_response.url,
+                'totp_form_fields': totp_form_fields,
+            }
+            self.log.info("✅ Staged at TOTP page")
+            return True
+
+        except Exception as e:
+            self._report_exception(e, auth_code)
+            return False
+        finally:
+            self.prepare_seconds = time.time() - self.start_time
+            if not self.staged:
+                self.timer.emit(False, self.last_outcome)
+                self.timer = None
+
+    def commit(self):
+        """Steps 5-6: submit the TOTP for a session staged by prepare() and verify success"""
+        if not self.staged:
+            self.log.error("❌ Nothing staged - call prepare() first")
+            return False
+        auth_code = self.staged['auth_code']
+        username = self.account.username
+        commit_start = time.time()
+        success = False
+        
+        try:
             # ═══════════════════════════════════════════════════════════
             # STEP 5: Generate and submit TOTP (with retry logic)
             # ═══════════════════════════════════════════════════════════
             totp_response = self.submit_totp_with_retry(
-                login_response.url,
-                totp_form_fields,
+                self.staged['totp_url'],
+                self.staged['totp_form_fields'],
                 username,
                 auth_code,
                 max_retries=1
@@ -372,74 +352,77 @@ class StockoAPILoginV2:
             # ═══════════════════════════════════════════════════════════
             # STEP 6: Verify success
             # ═══════════════════════════════════════════════════════════
-            print(f"\n[{self.tag}] STEP 6: Verifying success...")
+            self.log.info("STEP 6: Verifying success...")
             
             # Validate final response
             if totp_response.status_code >= 400:
                 error_msg = f"Final verification failed: HTTP {totp_response.status_code}"
-                print(f"[{self.tag}] ❌ Final response error: {totp_response.status_code}")
-                send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                self.log.error(f"❌ Final response error: {totp_response.status_code}")
+                self.last_outcome = UNEXPECTED
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
             final_url = totp_response.url
-            final_text = totp_response.text.lower()
             
             # Validate we got HTML response
-            if not final_text or len(final_text) < 10:
+            if len(totp_response.content) < MIN_BODY_SIZE:
                 error_msg = "Empty or invalid final response"
-                print(f"[{self.tag}] ❌ Response too small or empty")
-                send_telegram_notification(self.tag, username, auth_code, success=False, error_message=error_msg)
+                self.log.error("❌ Response too small or empty")
+                self.last_outcome = UNEXPECTED
+                self._notify(self.tag, self.account, auth_code, success=False, error_message=error_msg)
                 return False
             
-            # Strict success check
-            is_success_url = 'success' in final_url.lower()
-            is_success_text = 'success' in final_text
-            
-            if is_success_url or is_success_text:
-                duration = time.time() - start_time
-                print(f"\n[{self.tag}] ═══════════════════════════════════════════════════════════")
-                print(f"[{self.tag}] ✓✓✓ LOGIN SUCCESSFUL! ✓✓✓")
-                print(f"[{self.tag}] ═══════════════════════════════════════════════════════════")
-                print(f"[{self.tag}] ✓ Final URL: {final_url}")
-                print(f"[{self.tag}] ✓ Total Duration: {duration:.1f} seconds")
+            # Strict success check ('success' in the final URL or page, classified in step 5)
+            if self.last_outcome == SUCCESS:
+                # Active time (prepare + commit), not including a two-phase hold - as in the batch table
+                duration = self.prepare_seconds + time.time() - commit_start
+                self.log.info(f"✓✓✓ LOGIN SUCCESSFUL! ✓✓✓ ({duration:.1f}s)")
+                self.log.debug(f"✓ Final URL: {final_url}")
                 if hasattr(self, 'last_totp_code'):
-                    print(f"[{self.tag}] ✓ TOTP Used: {self.last_totp_code}")
+                    self.log.debug(f"✓ TOTP Used: {self.last_totp_code}")
                 
-                send_telegram_notification(
-                    self.tag, username, auth_code,
+                self._notify(
+                    self.tag, self.account, auth_code,
                     success=True,
                     duration=duration,
                     totp_code=self.last_totp_code if hasattr(self, 'last_totp_code') else None,
                     final_url=final_url
                 )
                 
+                success = True
                 return True
             else:
                 error_msg = f"Login verification failed. Final URL: {final_url[:80]}... - No 'success' indicator found"
-                print(f"[{self.tag}] ❌ SUCCESS NOT VERIFIED")
-                print(f"[{self.tag}] Final URL: {final_url}")
-                print(f"[{self.tag}] Contains 'success' in URL: {is_success_url}")
-                print(f"[{self.tag}] Contains 'success' in text: {is_success_text}")
-                print(f"[{self.tag}] Content (first 300 chars): {totp_response.text[:300]}")
-                send_telegram_notification(self.tag, username, auth_code, success=False, totp_code=self.last_totp_code if hasattr(self, 'last_totp_code') else None, error_message=error_msg)
+                self.log.error("❌ SUCCESS NOT VERIFIED")
+                self.log.debug("Final response", fields={'final_url': final_url, 'outcome': self.last_outcome,
+                                                         'content': totp_response.text[:300]})
+                self._notify(self.tag, self.account, auth_code, success=False, totp_code=self.last_totp_code if hasattr(self, 'last_totp_code') else None, error_message=error_msg)
                 return False
-
+        
         except Exception as e:
-            error_msg = f"Exception: {str(e)[:100]}"
-            print(f"\n[{self.tag}] ❌ ERROR: {e}")
-            import traceback
-            traceback.print_exc()
-            # Try to send notification about the exception
-            try:
-                send_telegram_notification(
-                    self.tag, username, auth_code, 
-                    success=False, 
-                    error_message=error_msg
-                )
-            except:
-                pass
+            self._report_exception(e, auth_code)
             return False
+        finally:
+            self.staged = None
+            if self.timer:
+                self.timer.emit(success, self.last_outcome)
+                self.timer = None
 
+    def _report_exception(self, e, auth_code):
+        """Print and notify an unexpected exception from prepare() or commit()"""
+        error_msg = f"Exception: {str(e)[:100]}"
+        self.log.error(f"❌ ERROR: {e}")
+        self.log.debug("Traceback", exc_info=True)
+        self.last_outcome = None  # failed on the exception, not on the last classified response
+        # Try to send notification about the exception
+        try:
+            self._notify(
+                self.tag, self.account, auth_code, 
+                success=False, 
+                error_message=error_msg
+            )
+        except:
+            pass
 
 def main():
     # Check for BeautifulSoup
@@ -450,17 +433,28 @@ def main():
         import subprocess
         subprocess.check_call([sys.executable, "-m", "pip", "install", "beautifulsoup4"])
     
+    # Determine which user config to load (default GJ114, override with USER_ID env var)
+    user_id = os.getenv('USER_ID', 'GJ114')
+    account = Account.from_dotenv(user_id)
+
     # Get auth code
-    auth_code = get_credential('AUTH_CODE')
+    auth_code = account.auth_code
     if not auth_code:
-        print(f"ERROR: AUTH_CODE not set for user {USER_ID}")
-        print(f"Checked: {USER_ID}_AUTH_CODE or STOCKO_AUTH_CODE")
-        print(f"Make sure .env.{USER_ID} file exists or GitHub Secrets are configured")
+        print(f"ERROR: AUTH_CODE not set for user {user_id}")
+        print(f"Checked: {user_id}_AUTH_CODE")
+        print(f"Make sure .env.{user_id} file exists or GitHub Secrets are configured")
         sys.exit(1)
 
-    print(f"[INFO] Using user config: {USER_ID}")
-    login = StockoAPILoginV2()
+    get_logger("INFO").info(f"Using user config: {user_id}")
+    record_path = os.getenv('STOCKO_RECORD')
+    if record_path:
+        RECORDER.start()
+    login = StockoAPILoginV2(account)
+    login.prewarm()
     result = login.login(auth_code)
+    login.clock.save()
+    if record_path:
+        RECORDER.save(record_path)
     
     sys.exit(0 if result else 1)
 
@@ -0,0 +1,245 @@
+"""
+Stocko Broker Auto Login - Batch Runner
+Logs in many accounts from one process on a bounded thread pool
+
+Usage:
+  Local:     python stocko_batch_login.py GJ114 PP450 RR1001
+  Registry:  python stocko_batch_login.py --registry accounts.json [USER_ID ...]
+  Two-phase: python stocko_batch_login.py --two-phase --commit-at 03:45:00 GJ114 PP450
+  GitHub:    Set BATCH_USER_IDS=GJ114,PP450,RR1001 (plus '<USER_ID>_*' secrets)
+
+Two-phase mode stages every account at the TOTP page first (steps 1-4), then
+submits all TOTPs in one burst at --commit-at (UTC HH:MM[:SS] today,
+YYYY-MM-DD HH:MM[:SS] UTC or unix time). A trigger that passed less than 15
+minutes ago commits right after staging; an older one is an error.
+
+Optional:
+  BATCH_MAX_WORKERS - thread pool size (default 8)
+  STOCKO_REGISTRY   - registry file, same as --registry
+  BATCH_COMMIT_AT   - two-phase trigger, same as --commit-at
+  TELEGRAM_DIGEST   - 'on' or 'failures', same as --digest
+  TELEGRAM_STATUS_BOARD=1 - same as --status-board
+  STOCKO_METRICS_PORT - same as --metrics-port
+  STOCKO_METRICS_FILE - same as --metrics-file
+"""
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from stocko_auto_login_GJ114_API_V2 import StockoAPILoginV2
+from stocko_cli import (
+    build_arg_parser,
+    new_result,
+    parse_commit_at,
+    print_results,
+    resolve_accounts,
+    start_status_board,
+)
+from stocko_notify import NOTIFIER, send_digest
+from stocko_metrics import METRICS
+from stocko_log import configure_logging, get_logger
+from stocko_recorder import RECORDER
+from stocko_totp import ClockSkew
+from stocko_transport import PREWARM_LEAD, create_shared_adapter
+
+TAG = "BATCH"
+log = get_logger(TAG)
+DEFAULT_MAX_WORKERS = 8
+BURST_MAX_WORKERS = 64  # threads released together by the two-phase trigger
+
+
+def login_account(account, clock=None, adapter=None):
+    """Run one account's login and return its result row"""
+    start_time = time.time()
+    result = new_result(account)
+    try:
+        if not account.auth_code:
+            result['error'] = f"{account.user_id}_AUTH_CODE not set"
+            return result
+        result['success'] = StockoAPILoginV2(account, clock, adapter).login(account.auth_code)
+        if not result['success']:
+            result['error'] = "Login failed (see log)"
+    except Exception as e:
+        result['error'] = f"Exception: {str(e)[:100]}"
+    finally:
+        result['duration'] = time.time() - start_time
+    return result
+
+
+def run_batch(accounts, max_workers=DEFAULT_MAX_WORKERS, board=None, clock=None):
+    """Log in all accounts concurrently, returning results in input order
+
+    A StatusBoard, if given, is updated as each account finishes. Pass a
+    ClockSkew(cache_path=None) to keep the run out of the skew cache.
+    """
+    results = {}
+    clock = clock or ClockSkew()
+    workers = max(1, min(max_workers, len(accounts)))
+    # One connection pool for the whole fleet, warmed once before any login
+    adapter = create_shared_adapter(workers)
+    if accounts:
+        StockoAPILoginV2(accounts[0], clock, adapter).prewarm(workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stocko-login") as pool:
+        futures = [pool.submit(login_account, account, clock, adapter) for account in accounts]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['user_id']] = result
+            if board:
+                board.update(result)
+    clock.save()
+    return [results[account.user_id] for account in accounts]
+
+
+def wait_until(at):
+    """Sleep until unix time `at` (returns at once if it has passed)"""
+    while at is not None:
+        remaining = at - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 1.0))
+
+
+def _stage(engine):
+    """Phase 1 worker: steps 1-4, returns (ok, seconds)"""
+    start_time = time.time()
+    try:
+        ok = engine.prepare(engine.account.auth_code)
+    except Exception as e:
+        log.error(f"❌ {engine.user_id} prepare exception: {e}")
+        ok = False
+    return ok, time.time() - start_time
+
+
+def _commit_on_trigger(engine, trigger):
+    """Phase 2 worker: wait for the trigger, then steps 5-6; returns (ok, seconds, finished_at)"""
+    trigger.wait()
+    start_time = time.time()
+    try:
+        ok = engine.commit()
+    except Exception as e:
+        log.error(f"❌ {engine.user_id} commit exception: {e}")
+        ok = False
+    finished_at = time.time()
+    return ok, finished_at - start_time, finished_at
+
+
+def run_two_phase(accounts, max_workers=DEFAULT_MAX_WORKERS, commit_at=None, board=None):
+    """Stage all accounts at the TOTP page, then commit every TOTP together at `commit_at`
+
+    Result 'duration' is active time (prepare + commit), excluding the hold.
+    A StatusBoard, if given, shows accounts as staged, then as they finish.
+    """
+    clock = ClockSkew()
+    workers = max(1, min(max_workers, len(accounts)))
+    burst = max(1, min(len(accounts), BURST_MAX_WORKERS))
+    adapter = create_shared_adapter(max(workers, burst))
+    results = {account.user_id: new_result(account) for account in accounts}
+    engines = []
+    for account in accounts:
+        if not account.auth_code:
+            results[account.user_id]['error'] = f"{account.user_id}_AUTH_CODE not set"
+        else:
+            engines.append(StockoAPILoginV2(account, clock, adapter))
+
+    # Phase 1: steps 1-4 for everyone, off the critical window
+    if engines:
+        engines[0].prewarm(workers)
+    log.info(f"PHASE 1: Staging {len(engines)} accounts at the TOTP page...")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stocko-stage") as pool:
+        staged = list(pool.map(_stage, engines))
+    ready = []
+    for engine, (ok, seconds) in zip(engines, staged):
+        results[engine.user_id]['duration'] = seconds
+        if ok:
+            ready.append(engine)
+            if board:
+                board.mark_staged(engine.user_id)
+        else:
+            results[engine.user_id]['error'] = "Staging failed (see log)"
+    if board:
+        for result in results.values():
+            if result['error']:
+                board.update(result)
+    log.info(f"PHASE 1: {len(ready)}/{len(engines)} staged")
+
+    # Phase 2: one trigger releases every TOTP POST together
+    if ready:
+        trigger = threading.Event()
+        finished = []
+        burst = max(1, min(len(ready), BURST_MAX_WORKERS))
+        with ThreadPoolExecutor(max_workers=burst, thread_name_prefix="stocko-commit") as pool:
+            futures = {pool.submit(_commit_on_trigger, engine, trigger): engine for engine in ready}
+            if commit_at:
+                log.info(f"PHASE 2: Holding until {datetime.fromtimestamp(commit_at, timezone.utc):%H:%M:%S} UTC...")
+                wait_until(commit_at - PREWARM_LEAD)
+            # Top the shared pool up to burst size so the TOTP POSTs don't pay for handshakes
+            ready[0].prewarm(burst)
+            wait_until(commit_at)
+            released_at = time.time()
+            log.info(f"PHASE 2: Committing {len(ready)} TOTPs")
+            trigger.set()
+            for future in as_completed(futures):
+                engine = futures[future]
+                ok, seconds, finished_at = future.result()
+                result = results[engine.user_id]
+                result['success'] = ok
+                result['duration'] += seconds
+                if ok:
+                    finished.append(finished_at)
+                else:
+                    result['error'] = "TOTP commit failed (see log)"
+                if board:
+                    board.update(result)
+        if finished:
+            log.info(f"PHASE 2: Tokens issued within {max(finished) - released_at:.2f}s of the trigger")
+
+    clock.save()
+    return [results[account.user_id] for account in accounts]
+
+
+def main():
+    args = build_arg_parser("Log in many Stocko accounts from one process").parse_args()
+    configure_logging(quiet=args.quiet, verbose=args.verbose)
+    try:
+        accounts = resolve_accounts(args.user_ids, args.registry)
+        commit_at = parse_commit_at(args.commit_at)
+        NOTIFIER.set_digest(args.digest)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if not accounts:
+        print(f"ERROR: No accounts given. Pass USER_IDs, --registry FILE or set BATCH_USER_IDS")
+        sys.exit(1)
+
+    max_workers = int(os.getenv('BATCH_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    log.info(f"Logging in {len(accounts)} accounts with up to {max_workers} workers")
+
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    if args.record:
+        RECORDER.start()
+    board = start_status_board(accounts, args, "Stocko batch login")
+    start_time = time.time()
+    if args.two_phase:
+        results = run_two_phase(accounts, max_workers, commit_at, board)
+    else:
+        results = run_batch(accounts, max_workers, board)
+    wall_time = time.time() - start_time
+    print_results(results, wall_time)
+    if board:
+        board.close()
+    if args.metrics_file:
+        METRICS.write_textfile(args.metrics_file)
+    if args.record:
+        RECORDER.save(args.record)
+    if NOTIFIER.digest:
+        send_digest(accounts, results, wall_time)
+
+    sys.exit(0 if all(r['success'] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
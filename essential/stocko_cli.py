@@ -0,0 +1,145 @@
+"""
+Shared command line of the batch runners
+Argument parser, account resolution, the --commit-at trigger and the result
+table used by both stocko_batch_login.py (threads) and stocko_async_login.py
+(asyncio). Imports neither login engine, so each runner only loads its own.
+"""
+import os
+import argparse
+from datetime import datetime, timezone
+
+from stocko_accounts import Account, load_registry
+from stocko_notify import NOTIFIER, PER_ACCOUNT_NONE, StatusBoard
+from stocko_log import flush_logging, get_logger
+
+TAG = "BATCH"
+log = get_logger(TAG)
+COMMIT_AT_MAX_LATE = 15 * 60  # a --commit-at this far in the past still commits (at once)
+
+
+def load_accounts(user_ids):
+    """Resolve each account once, before any worker starts"""
+    return [Account.from_dotenv(user_id) for user_id in user_ids]
+
+
+def new_result(account):
+    """Empty per-account result row"""
+    return {'user_id': account.user_id, 'success': False, 'duration': 0.0, 'error': None}
+
+
+def resolve_accounts(user_ids, registry=None):
+    """Enabled accounts from the registry if given, else from USER_IDs"""
+    user_ids = parse_user_ids(user_ids)
+    if not registry:
+        return load_accounts(user_ids)
+
+    accounts = [a for a in load_registry(registry) if a.enabled]
+    if user_ids:
+        accounts = [a for a in accounts if a.user_id in user_ids]
+    return accounts
+
+
+def parse_user_ids(argv):
+    """Accounts come from argv, falling back to BATCH_USER_IDS"""
+    raw = argv if argv else os.getenv('BATCH_USER_IDS', '').split(',')
+    user_ids = []
+    for user_id in raw:
+        user_id = user_id.strip()
+        if user_id and user_id not in user_ids:
+            user_ids.append(user_id)
+    return user_ids
+
+
+def parse_commit_at(value):
+    """Two-phase trigger time: unix timestamp, YYYY-MM-DD HH:MM[:SS] or HH:MM[:SS] (today), UTC
+
+    A trigger up to COMMIT_AT_MAX_LATE in the past is returned as is, so the
+    TOTPs are committed right after staging; an older one raises ValueError.
+    A later day needs the date (or unix time) spelled out.
+    """
+    if not value:
+        return None
+    now = datetime.now(timezone.utc)
+    try:
+        target = datetime.fromtimestamp(float(value), timezone.utc)
+    except (ValueError, OverflowError):
+        try:
+            if '-' in value:
+                target = datetime.fromisoformat(value)
+                target = target.replace(tzinfo=timezone.utc) if target.tzinfo is None else target
+            else:
+                parts = [int(p) for p in value.split(':')]
+                if len(parts) not in (2, 3):
+                    raise ValueError
+                target = now.replace(hour=parts[0], minute=parts[1], second=parts[2] if len(parts) == 3 else 0,
+                                     microsecond=0)
+        except ValueError:
+            raise ValueError(f"--commit-at must be HH:MM[:SS] or YYYY-MM-DD HH:MM[:SS] UTC or a unix time, "
+                             f"got {value!r}")
+    late = (now - target).total_seconds()
+    if late > COMMIT_AT_MAX_LATE:
+        raise ValueError(f"--commit-at {value!r} ({target:%Y-%m-%d %H:%M:%S} UTC) passed {late / 60:.0f} min ago; "
+                         f"give the date or a unix time for a later day")
+    if late > 0:
+        log.warning(f"⚠️  --commit-at {target:%H:%M:%S} UTC passed {late:.0f}s ago - committing right after staging")
+    return target.timestamp()
+
+
+def build_arg_parser(description):
+    """Command line shared by the batch runners"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('user_ids', nargs='*', metavar='USER_ID',
+                        help="accounts to log in (default: BATCH_USER_IDS, or all enabled registry accounts)")
+    parser.add_argument('--registry', default=os.getenv('STOCKO_REGISTRY'),
+                        help="account registry JSON file (default: STOCKO_REGISTRY)")
+    parser.add_argument('--two-phase', action='store_true',
+                        help="stage every account at the TOTP page, then commit all TOTPs together")
+    parser.add_argument('--commit-at', default=os.getenv('BATCH_COMMIT_AT'),
+                        help="two-phase trigger: UTC HH:MM[:SS] today, UTC YYYY-MM-DD HH:MM[:SS] or unix time "
+                             "(default: right after staging)")
+    parser.add_argument('--digest', nargs='?', const='on', default=os.getenv('TELEGRAM_DIGEST'),
+                        help="one Telegram summary per chat at the end of the run instead of a message per "
+                             "account; 'failures' still sends failures individually (default: TELEGRAM_DIGEST)")
+    parser.add_argument('--status-board', action='store_true',
+                        default=os.getenv('TELEGRAM_STATUS_BOARD', '').lower() in ('1', 'true', 'yes', 'on'),
+                        help="one live Telegram message per chat, edited as accounts finish, instead of a "
+                             "message per account (default: TELEGRAM_STATUS_BOARD)")
+    parser.add_argument('--metrics-port', type=int, default=os.getenv('STOCKO_METRICS_PORT'),
+                        help="serve Prometheus metrics on this port while the run lasts (default: STOCKO_METRICS_PORT)")
+    parser.add_argument('--metrics-file', default=os.getenv('STOCKO_METRICS_FILE'),
+                        help="write Prometheus metrics to this node-exporter textfile at the end "
+                             "(default: STOCKO_METRICS_FILE)")
+    parser.add_argument('--record', default=os.getenv('STOCKO_RECORD'), metavar='FILE',
+                        help="record every request/response (secrets redacted) to a HAR-like archive, "
+                             "gzipped if FILE ends in .gz (default: STOCKO_RECORD)")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument('-q', '--quiet', action='store_true',
+                           help="only log warnings and errors (the result table is still printed)")
+    verbosity.add_argument('-v', '--verbose', action='store_true',
+                           help="also log request/response details (default level: STOCKO_LOG_LEVEL or INFO)")
+    return parser
+
+
+def start_status_board(accounts, args, title):
+    """StatusBoard for the run if --status-board was given (per-account messages off unless --digest says otherwise)"""
+    if not args.status_board:
+        return None
+    if not NOTIFIER.digest:
+        NOTIFIER.per_account = PER_ACCOUNT_NONE
+    return StatusBoard(accounts, title).start()
+
+
+def print_results(results, wall_time):
+    """Print per-account result table"""
+    flush_logging(restart=True)  # so queued log lines don't land inside the table
+    print("\n" + "="*70)
+    print(f"[{TAG}] {'Account':<12} {'Status':<8} {'Duration':>9}  Error")
+    print(f"[{TAG}] {'-'*12} {'-'*8} {'-'*9}  {'-'*30}")
+    for r in results:
+        status = "✅ OK" if r['success'] else "❌ FAIL"
+        print(f"[{TAG}] {r['user_id']:<12} {status:<8} {r['duration']:>8.1f}s  {r['error'] or ''}")
+    ok = sum(1 for r in results if r['success'])
+    slowest = max((r['duration'] for r in results), default=0.0)
+    total = sum(r['duration'] for r in results)
+    print("="*70)
+    print(f"[{TAG}] {ok}/{len(results)} succeeded | wall {wall_time:.1f}s | slowest {slowest:.1f}s | sum {total:.1f}s")
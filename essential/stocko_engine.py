@@ -0,0 +1,175 @@
+"""
+Shared pieces of the Stocko login engines
+The requests engine (stocko_auto_login_GJ114_API_V2.StockoAPILoginV2) and the
+asyncio engine (stocko_async_login.StockoAsyncLogin) drive the same OAuth flow
+over different HTTP clients. What doesn't touch the network lives here:
+browser headers, the Telegram message, form field extraction, TOTP codes and
+step timing. StockoLoginBase holds no session, so each engine builds only the
+client it uses.
+"""
+import os
+import logging
+from pyotp import TOTP
+from datetime import datetime, timezone, timedelta
+from bs4 import BeautifulSoup
+from contextlib import nullcontext
+
+from stocko_totp import ClockSkew
+from stocko_notify import NOTIFIER
+from stocko_log import get_logger
+from stocko_forms import SCHEMA_CACHE, fast_extract_form_fields
+
+STOCKO_BASE_URL = "https://sasstocko.broker.tradetron.tech"
+STOCKO_API_URL = "https://api.stocko.in"
+
+
+def send_telegram_notification(tag, account, auth_code, success=True, duration=None, totp_code=None, final_url=None, error_message=None):
+    """Send Telegram notification (queued, sent in the background)"""
+    bot_token = account.telegram_bot_token
+    chat_id = account.telegram_chat_id
+    username = account.username
+
+    # Digest mode (fleet runs) may hold this back for the end-of-run summary
+    if not NOTIFIER.record(account.user_id, success, error_message):
+        return
+
+    if not bot_token or not chat_id:
+        get_logger(tag).info(f"Telegram not configured: TELEGRAM_BOT_TOKEN={'set' if bot_token else 'MISSING'}, TELEGRAM_CHAT_ID={'set' if chat_id else 'MISSING'}")
+        return
+
+    ist = timezone(timedelta(hours=5, minutes=30))
+    now_ist = datetime.now(ist)
+    timestamp = now_ist.strftime("%Y-%m-%d %H:%M:%S")
+
+    # Header with username
+    message = f"<b>Token Status for {username}</b>\n"
+
+    # Status line
+    if success:
+        message += f"<b>Status - ✅ Token Generated</b>\n"
+    else:
+        error_text = str(error_message)[:100] if error_message else "Unknown error"
+        message += f"<b>Status - ❌ {error_text}</b>\n"
+
+    # Account details
+    message += f"\n👤 Account: <code>{username}</code>\n"
+    message += f"🔑 Auth: <code>{auth_code}</code>\n"
+    message += f"⏰ Time: <code>{timestamp}</code>\n"
+
+    # Additional details only on success
+    if success:
+        if totp_code:
+            message += f"• TOTP: <code>{totp_code}</code>\n"
+        if duration:
+            message += f"• ⏳ Duration: <code>{duration:.1f}s</code>\n"
+        message += f"• 🖥️ Type: <code>API (No Browser)</code>\n"
+
+    # Queued - the background sender posts it, the login doesn't wait
+    NOTIFIER.send(tag, bot_token, chat_id, message)
+
+
+# Realistic browser headers (shared by the requests and asyncio engines)
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Cache-Control': 'max-age=0',
+}
+
+
+class StockoLoginBase:
+    """Account, URLs, clock and logger of one login, plus its client-independent steps"""
+
+    def __init__(self, account, clock=None, engine='API-V2'):
+        # STOCKO_BASE_URL / STOCKO_API_URL point the flow at a stand-in server (benchmarks/fake_stocko.py)
+        self.base_url = os.getenv('STOCKO_BASE_URL', STOCKO_BASE_URL)
+        self.api_url = os.getenv('STOCKO_API_URL', STOCKO_API_URL)
+        self.account = account
+        self.user_id = account.user_id
+        self.tag = f"{self.user_id}-{engine}"
+        self.log = get_logger(self.tag)
+        # Server clock estimate for TOTP (share one across accounts in batch runs)
+        self.clock = clock or ClockSkew()
+        self.timer = None  # StepTimer for the login in progress
+
+    def _step(self, name, network=True):
+        """Time a block as one step of the current login (no-op outside a login)"""
+        return self.timer.step(name, network) if self.timer else nullcontext()
+
+    def extract_form_fields(self, html, kind=None):
+        """Extract ALL form fields from HTML
+
+        With a page `kind` ('login', 'twofa') the cached form schema is tried
+        first; otherwise (or if the page changed) the fast tokenizer, then
+        BeautifulSoup. A full parse refreshes the schema for next time.
+        """
+        try:
+            if not html or not isinstance(html, str):
+                self.log.error("❌ Invalid HTML content")
+                return {}
+            
+            fields = SCHEMA_CACHE.extract(kind, html) if kind else None
+            if fields is None:
+                try:
+                    fields = fast_extract_form_fields(html)
+                except Exception as e:
+                    self.log.warning(f"⚠️  Fast form extraction failed ({e}), using BeautifulSoup")
+                if fields is None:
+                    fields = self._extract_form_fields_bs4(html)
+                    if fields is None:
+                        return {}
+                if kind and fields:
+                    SCHEMA_CACHE.learn(kind, html, fields)
+            
+            if self.log.isEnabledFor(logging.DEBUG):
+                for name, value in fields.items():
+                    display_val = value[:30] if len(str(value)) > 30 else value
+                    self.log.debug(f"Found field: {name}={display_val}")
+            
+            if not fields:
+                self.log.warning("⚠️  No input fields found in form")
+                return {}
+            
+            return fields
+        except Exception as e:
+            self.log.error(f"❌ Error extracting form fields: {e}")
+            return {}
+
+    def _extract_form_fields_bs4(self, html):
+        """Full BeautifulSoup parse of the first form - returns None if there is no form"""
+        soup = BeautifulSoup(html, 'html.parser')
+        form = soup.find('form')
+        if not form:
+            self.log.warning("⚠️  No form found in HTML")
+            return None
+        
+        fields = {}
+        # Extract all input fields
+        for input_field in form.find_all('input'):
+            name = input_field.get('name')
+            value = input_field.get('value', '')
+            if name:
+                fields[name] = value
+        return fields
+
+    def get_totp_code(self, for_time=None):
+        """Generate TOTP code (for the server's current time, or `for_time` if given)"""
+        try:
+            totp_secret = self.account.totp_secret
+            if not totp_secret:
+                self.log.error(f"❌ TOTP_SECRET not set for user {self.user_id}")
+                raise ValueError("TOTP secret missing")
+            totp = TOTP(totp_secret)
+            code = totp.at(for_time if for_time is not None else self.clock.now())
+            self.log.debug(f"Generated TOTP: {code}")
+            return code
+        except Exception as e:
+            self.log.error(f"❌ Error generating TOTP: {e}")
+            raise
@@ -0,0 +1,220 @@
+"""
+Fast form field extraction
+Single-pass tokenizer for the login and twofa pages: finds the first <form>
+and reads its <input> name/value pairs without building a parse tree.
+
+Same contract as StockoLoginBase.extract_form_fields(): {name: value}, value
+defaults to '', later inputs with the same name win. Returns None when it
+can't be sure (no form, no inputs), so callers fall back to BeautifulSoup.
+
+FormSchemaCache goes one step further for pages seen before: it only reads
+the handful of server-generated fields a cached schema says are there.
+"""
+import re
+import json
+import threading
+from html import unescape
+from pathlib import Path
+
+from stocko_log import get_logger
+
+SCHEMA_CACHE_PATH = Path(__file__).parent / '.form_schema.json'
+
+FORM_OPEN = re.compile(r'<form\b[^>]*>', re.IGNORECASE)
+FORM_CLOSE = re.compile(r'</form\s*>', re.IGNORECASE)
+# Inputs inside comments, scripts or styles aren't real fields (html.parser agrees)
+SKIPPED = re.compile(r'<!--.*?-->|<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+# <form> / </form>, or the start of a comment, script or style to step over
+# (the shared '<' is kept outside the group so re can jump from one '<' to the next)
+FORM_OPEN_SCAN = re.compile(r'<(?:(!--|script\b|style\b)|(?P<tag>form\b[^>]*>))', re.IGNORECASE)
+FORM_CLOSE_SCAN = re.compile(r'<(?:(!--|script\b|style\b)|(?P<tag>/form\s*>))', re.IGNORECASE)
+SKIPPED_END = {
+    '!--': re.compile(r'-->'),
+    'script': re.compile(r'</script\s*>', re.IGNORECASE),
+    'style': re.compile(r'</style\s*>', re.IGNORECASE),
+}
+INPUT_TAG = re.compile(r'<input\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.IGNORECASE)
+ATTRIBUTE = re.compile(r'''([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?''')
+VALUE_ATTRIBUTE = re.compile(r'''(?<!\S)value\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+
+def parse_attributes(attrs):
+    """Attribute string of one tag -> {name: value}, last duplicate wins (like BeautifulSoup)"""
+    parsed = {}
+    for match in ATTRIBUTE.finditer(attrs):
+        name = match.group(1).lower()
+        value = match.group(2)
+        if value is None:
+            value = match.group(3)
+        if value is None:
+            value = match.group(4)
+        parsed[name] = unescape(value) if value else ''
+    return parsed
+
+
+def find_tag(scan, html, pos=0):
+    """First FORM_OPEN_SCAN / FORM_CLOSE_SCAN tag at or after pos, outside comments, scripts and styles
+
+    Returns (match, None), or (None, resume) when there is none: resume is
+    where to search again once more of the page has arrived - an unclosed
+    comment or script, or the last '<' (a tag may be cut off there).
+    """
+    while True:
+        match = scan.search(html, pos)
+        if match and match.group('tag'):
+            return match, None
+        if not match:
+            last_open = html.rfind('<', pos)
+            return None, last_open if last_open != -1 else len(html)
+        end = SKIPPED_END[match.group(1).lower()].search(html, match.end())
+        if not end:
+            return None, match.start()  # an unterminated one runs to the end of the page
+        pos = end.end()
+
+
+def first_form_html(html):
+    """Markup of the first <form>, up to its </form> (or the end of the document)"""
+    start, _ = find_tag(FORM_OPEN_SCAN, html)
+    if not start:
+        return None
+    end, _ = find_tag(FORM_CLOSE_SCAN, html, start.end())
+    return html[start.end():end.start() if end else len(html)]
+
+
+def fast_extract_form_fields(html):
+    """{name: value} for the first form's inputs, or None to fall back to a full parse"""
+    form = first_form_html(html)
+    if form is None:
+        return None
+    form = SKIPPED.sub('', form)
+    fields = {}
+    for tag in INPUT_TAG.finditer(form):
+        attrs = parse_attributes(tag.group(1))
+        name = attrs.get('name')
+        if name:
+            fields[name] = attrs.get('value', '')
+    return fields or None
+
+
+class StreamingFormReader:
+    """Incremental reader that stops as soon as the first </form> has arrived
+
+    feed() decoded text chunks until it returns True; `text` then holds the
+    page up to and including that </form>, ready for fast_extract_form_fields().
+    Like first_form_html(), it steps over comments, scripts and styles, waiting
+    for the end of one split across chunks.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.form_start = None
+        self.done = False
+        self._scan_from = 0
+
+    def _search(self, scan):
+        match, resume = find_tag(scan, self.text, self._scan_from)
+        if not match:
+            self._scan_from = resume
+        return match
+
+    def feed(self, chunk):
+        """Add a chunk; returns True once the first form is complete"""
+        if self.done or not chunk:
+            return self.done
+        self.text += chunk
+        if self.form_start is None:
+            match = self._search(FORM_OPEN_SCAN)
+            if match:
+                self.form_start = self._scan_from = match.end()
+        if self.form_start is not None and self._search(FORM_CLOSE_SCAN):
+            self.done = True
+        return self.done
+
+
+class FormSchemaCache:
+    """Learned shape of the login and twofa forms, for targeted extraction
+
+    After one full parse of a page, the schema remembers its field names,
+    which of them carry server-generated values (login_challenge,
+    _csrf_token, twofa_token, ...), the exact `name=...` text of each of
+    those inputs, the `name=...` text of the empty ones and how many <input>
+    tags the form has. Later pages of the same kind are read by cutting out
+    the first form and jumping straight to those inputs with str.find(), so
+    the rest of the page is only scanned once, for the form's bounds.
+    Any mismatch returns None so the caller does a full parse and calls
+    learn() again.
+    """
+
+    def __init__(self, cache_path=SCHEMA_CACHE_PATH):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.schemas = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.cache_path or not self.cache_path.exists():
+            return
+        try:
+            self.schemas = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            self.schemas = {}
+
+    def extract(self, kind, html):
+        """{name: value} using the cached schema, or None if there is none or the page changed"""
+        schema = self.schemas.get(kind)
+        if not schema or 'static' not in schema:
+            return None
+        form = first_form_html(html)
+        if form is None or form.count('<input') != schema['input_count']:
+            return None
+        # Empty fields aren't re-read, but a renamed one (e.g. answers[]) must not be served from the cache
+        if any(needle not in form for needle in schema['static']):
+            return None
+        fields = dict.fromkeys(schema['fields'], '')
+        for name, needle in schema['dynamic'].items():
+            pos = form.find(needle)
+            if pos == -1 or not form[pos - 1:pos].isspace():  # not e.g. data-name="..."
+                return None
+            start = form.rfind('<', 0, pos)
+            end = form.find('>', pos)
+            if start == -1 or end == -1 or form[start + 1:start + 6].lower() != 'input':
+                return None
+            # Only the value is needed, not a full parse_attributes() of the tag
+            value = VALUE_ATTRIBUTE.search(form, start, end)
+            value = value[value.lastindex] if value else ''
+            fields[name] = unescape(value) if value else ''
+        return fields
+
+    def learn(self, kind, html, fields):
+        """Store the schema of a fully parsed page (fields in form order)"""
+        form = first_form_html(html)
+        if form is None:
+            return
+        dynamic = {}
+        static = []
+        for name, value in fields.items():
+            needle = next((n for n in (f'name="{name}"', f"name='{name}'", f'name={name}') if n in form), None)
+            if needle is None:
+                return  # unusual markup - keep doing full parses
+            if value:
+                dynamic[name] = needle  # pre-filled by the server, re-read every time
+            else:
+                static.append(needle)   # only checked to still be there
+        schema = {
+            'fields': list(fields),
+            'dynamic': dynamic,
+            'static': static,
+            'input_count': form.count('<input'),
+        }
+        with self._lock:
+            if self.schemas.get(kind) == schema:
+                return
+            self.schemas[kind] = schema
+            if self.cache_path:
+                try:
+                    self.cache_path.write_text(json.dumps(self.schemas, indent=2))
+                except OSError as e:
+                    get_logger("FORMS").warning(f"⚠️  Could not cache form schema: {e}")
+
+
+SCHEMA_CACHE = FormSchemaCache()
@@ -0,0 +1,113 @@
+"""
+Logging for the Stocko login tools
+Every line is tagged with its account or component ("GJ114-API-V2", "BATCH",
+"TELEGRAM", ...). Text output keeps the familiar "[TAG] message" lines;
+STOCKO_LOG_FORMAT=json writes one JSON object per line (ts, level, tag, msg
+plus any key/value `fields=`).
+
+Records go through a QueueHandler and are written by one listener thread,
+so hundreds of login threads never contend for stdout.
+
+Levels: STOCKO_LOG_LEVEL (default INFO); the batch runners' --quiet means
+WARNING and --verbose means DEBUG. Field dumps (form fields, cookies, URLs,
+status lines, response bodies) are DEBUG only.
+
+Usage:
+  log = get_logger("GJ114-API-V2")
+  log.info("✅ Staged at TOTP page")
+  log.debug("POST", fields={'url': url, 'status': 302})
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOGGER_NAME = 'stocko'
+DEFAULT_LEVEL = 'INFO'
+
+_listener = None
+
+
+class TextFormatter(logging.Formatter):
+    """[TAG] message key=value ..."""
+
+    def format(self, record):
+        text = f"[{getattr(record, 'tag', record.name)}] {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            text += '\n' + self.formatException(record.exc_info)
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'tag': getattr(record, 'tag', record.name),
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TaggedLogger(logging.LoggerAdapter):
+    """Logger adapter that stamps every record with a tag and optional `fields`"""
+
+    def process(self, msg, kwargs):
+        extra = dict(kwargs.get('extra') or {})
+        extra['tag'] = self.extra['tag']
+        extra['fields'] = kwargs.pop('fields', None)
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+
+def configure_logging(level=None, fmt=None, quiet=False, verbose=False, stream=None):
+    """(Re)configure the 'stocko' logger; safe to call more than once"""
+    global _listener
+    if verbose:
+        level = 'DEBUG'
+    elif quiet:
+        level = 'WARNING'
+    level = (level or os.getenv('STOCKO_LOG_LEVEL') or DEFAULT_LEVEL).upper()
+    fmt = (fmt or os.getenv('STOCKO_LOG_FORMAT') or 'text').lower()
+
+    flush_logging()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [logging.handlers.QueueHandler(records)]
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    logger.propagate = False
+    return logger
+
+
+def flush_logging(restart=False):
+    """Write out everything still queued; `restart` keeps logging going afterwards"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+        if restart:
+            _listener.start()
+
+
+def get_logger(tag):
+    """Tagged logger (configures logging from the environment on first use)"""
+    if _listener is None:
+        configure_logging()
+    return TaggedLogger(logging.getLogger(LOGGER_NAME), {'tag': tag})
+
+
+atexit.register(flush_logging)
@@ -0,0 +1,184 @@
+"""
+Prometheus metrics for login runs
+Fed by the per-login timing records (stocko_timing) and the Telegram sender,
+and exposed in the Prometheus text format either:
+  - over HTTP while the run is going: --metrics-port 9108 (or STOCKO_METRICS_PORT)
+  - as a node-exporter textfile written at the end of a batch run:
+      --metrics-file /var/lib/node_exporter/textfile/stocko.prom (or STOCKO_METRICS_FILE)
+
+Example alert on p99 login latency:
+  histogram_quantile(0.99, sum by (le) (rate(stocko_login_duration_seconds_bucket[1h]))) > 10
+"""
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stocko_log import get_logger
+from stocko_responses import SUCCESS
+
+TAG = "METRICS"
+log = get_logger(TAG)
+LOGIN_BUCKETS = (0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+STEP_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+TELEGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """One metric family; samples are keyed by their sorted label pairs"""
+
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self.samples.items()):
+                lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_labels(key)} {value}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.samples[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            sample = self.samples.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['buckets'][i] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+
+    def _render_sample(self, key, sample):
+        lines = [f"{self.name}_bucket{_labels(key + (('le', bound),))} {count}"
+                 for bound, count in zip(self.buckets, sample['buckets'])]
+        lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {sample['count']}")
+        lines.append(f"{self.name}_sum{_labels(key)} {round(sample['sum'], 6)}")
+        lines.append(f"{self.name}_count{_labels(key)} {sample['count']}")
+        return lines
+
+
+class LoginMetrics:
+    """All metrics for a run, plus the hooks that feed them"""
+
+    def __init__(self):
+        self.login_duration = Histogram(
+            'stocko_login_duration_seconds', "Active time of a login (sum of its steps)", LOGIN_BUCKETS)
+        self.step_duration = Histogram(
+            'stocko_login_step_duration_seconds', "Wall time of one login step", STEP_BUCKETS)
+        self.logins = Counter(
+            'stocko_logins_total', "Finished logins by result (success or failure class)")
+        self.totp_retries = Counter(
+            'stocko_totp_retries_total', "TOTP submissions after the first one")
+        self.telegram_duration = Histogram(
+            'stocko_telegram_request_duration_seconds', "Telegram Bot API request latency", TELEGRAM_BUCKETS)
+        self.telegram_requests = Counter(
+            'stocko_telegram_requests_total', "Telegram Bot API requests by result")
+        self.last_run = Gauge(
+            'stocko_last_run_timestamp_seconds', "Unix time the last run finished")
+        self.metrics = [self.login_duration, self.step_duration, self.logins, self.totp_retries,
+                        self.telegram_duration, self.telegram_requests, self.last_run]
+
+    def observe_login(self, record):
+        """Account for one StepTimer record (see stocko_timing)"""
+        engine = record['engine']
+        if record['success']:
+            result = 'success'
+        else:  # a failure after a successful step still carries that step's outcome
+            result = record['outcome'] if record['outcome'] not in (None, SUCCESS) else 'error'
+        self.logins.inc(engine=engine, result=result)
+        self.login_duration.observe(record['active_ms'] / 1000, engine=engine)
+        totp_posts = 0
+        for step in record['steps']:
+            self.step_duration.observe(step['wall_ms'] / 1000, engine=engine, step=step['step'])
+            totp_posts += step['step'] == 'totp_post'
+        if totp_posts > 1:
+            self.totp_retries.inc(totp_posts - 1, engine=engine)
+
+    def observe_telegram(self, method, seconds, result):
+        self.telegram_duration.observe(seconds, method=method)
+        self.telegram_requests.inc(method=method, result=result)
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+    def write_textfile(self, path):
+        """Write for node-exporter's textfile collector (atomically, so it never reads half a file)"""
+        self.last_run.set(round(time.time(), 3))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+            log.info(f"Metrics written to {path}")
+        except OSError as e:
+            log.warning(f"⚠️  Could not write {path}: {e}")
+
+    def serve(self, port, address=''):
+        """Serve /metrics over HTTP from a daemon thread; returns the server"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # scrapes would flood the login log
+
+        server = ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        log.info(f"Serving metrics on :{port}/metrics")
+        return server
+
+
+METRICS = LoginMetrics()
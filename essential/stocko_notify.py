@@ -0,0 +1,458 @@
+"""
+Background Telegram notifier
+The login flow only enqueues messages; one sender thread posts them to the
+Telegram Bot API, so a slow or unreachable Telegram never adds to login
+duration or holds a batch worker.
+
+Queued messages are flushed when the process exits (atexit), or earlier
+with NOTIFIER.flush().
+
+Sends are paced by token buckets (per chat and global, at Telegram's
+published limits). A 429 reply pauses that chat for its retry_after and the
+message is retried, not dropped; while a chat is backlogged its queued
+messages are merged into as few sends as the size limit allows.
+
+Fleet runs can switch to digest mode: per-account messages are dropped (or
+kept for failures only) and send_digest() posts one summary per chat,
+split to Telegram's message size limit. Or they can keep a StatusBoard: one
+message per chat, edited in place as accounts finish.
+"""
+import html
+import queue
+import atexit
+import time
+import threading
+import requests
+from collections import deque
+
+from stocko_metrics import METRICS
+from stocko_log import get_logger
+from datetime import datetime, timezone, timedelta
+
+TAG = "TELEGRAM"
+log = get_logger(TAG)
+TELEGRAM_API = "https://api.telegram.org"
+SEND_TIMEOUT = 10
+FLUSH_TIMEOUT = 30  # max seconds to wait for the queue at exit
+MESSAGE_LIMIT = 4096  # Telegram's max characters per message
+
+# Telegram Bot API limits: ~1 msg/s per chat, 20 msg/min per group, 30 msg/s overall
+CHAT_RATE, CHAT_BURST = 1.0, 3
+GROUP_RATE, GROUP_BURST = 20 / 60, 3
+GLOBAL_RATE, GLOBAL_BURST = 30.0, 30
+DEFAULT_RETRY_AFTER = 5  # seconds, if a 429 doesn't say
+BOARD_INTERVAL = 1.0     # min seconds between edits of one status board (the per-chat limit)
+
+# Which per-account messages to send (digest mode uses 'failures' or 'none')
+PER_ACCOUNT_ALL = 'all'
+PER_ACCOUNT_FAILURES = 'failures'
+PER_ACCOUNT_NONE = 'none'
+DIGEST_MODES = {'on': PER_ACCOUNT_NONE, 'failures': PER_ACCOUNT_FAILURES}
+
+
+def retry_after_seconds(resp):
+    """Back-off from a Telegram 429: parameters.retry_after, else the Retry-After header"""
+    try:
+        return float(resp.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return float(resp.headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+    except ValueError:
+        return DEFAULT_RETRY_AFTER
+
+
+def _result_label(resp):
+    """'ok', 'rate_limited' or 'http_<status>' for the request metrics"""
+    if resp.status_code == 200:
+        return 'ok'
+    return 'rate_limited' if resp.status_code == 429 else f"http_{resp.status_code}"
+
+
+class TokenBucket:
+    """`rate` sends per second, with up to `burst` saved up"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a send is allowed (0 if one is allowed now)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class TelegramNotifier:
+    """In-process queue plus one daemon sender thread (started on first send)
+
+    Only the sender thread touches the per-chat pending queues, buckets and
+    429 back-offs, so they need no locking.
+    """
+
+    def __init__(self, api_url=TELEGRAM_API, timeout=SEND_TIMEOUT):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.session = requests.Session()  # keep-alive to api.telegram.org
+        self.per_account = PER_ACCOUNT_ALL
+        self.digest = False
+        self.failure_reasons = {}  # user_id -> last error reported, for the digest
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = {}        # (bot_token, chat_id) -> deque of [tag, text, message count]
+        self._buckets = {}
+        self._blocked_until = {}  # chat -> monotonic time its 429 back-off ends
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+
+    def record(self, user_id, success, error_message=None):
+        """Note an account's outcome; returns True if its own message should still be sent"""
+        if not success and error_message:
+            self.failure_reasons[user_id] = str(error_message)
+        if self.per_account == PER_ACCOUNT_NONE:
+            return False
+        return not success or self.per_account == PER_ACCOUNT_ALL
+
+    def set_digest(self, mode):
+        """Digest mode 'on' (summary only) or 'failures' (summary + failure messages); None/'' = off"""
+        if not mode:
+            self.per_account = PER_ACCOUNT_ALL
+        elif mode in DIGEST_MODES:
+            self.per_account = DIGEST_MODES[mode]
+        else:
+            raise ValueError(f"Invalid digest mode {mode!r} (expected one of: {', '.join(DIGEST_MODES)})")
+        self.digest = bool(mode)
+
+    def send(self, tag, bot_token, chat_id, text):
+        """Queue an HTML message for a chat; returns immediately"""
+        self._start()
+        self.queue.put((tag, bot_token, chat_id, text))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        wait = None
+        while True:
+            try:
+                self._add(self.queue.get(timeout=wait))
+                while True:
+                    self._add(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            wait = self._send_ready()
+
+    def _add(self, item):
+        tag, bot_token, chat_id, text = item
+        self._pending.setdefault((bot_token, chat_id), deque()).append([tag, text, 1])
+
+    def _bucket(self, chat):
+        if chat not in self._buckets:
+            group = str(chat[1]).startswith('-')
+            self._buckets[chat] = TokenBucket(GROUP_RATE, GROUP_BURST) if group else TokenBucket(CHAT_RATE, CHAT_BURST)
+        return self._buckets[chat]
+
+    def _send_ready(self):
+        """Send whatever the limits allow now; returns seconds until the next send is due (None if idle)"""
+        while self._pending:
+            now = time.monotonic()
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                return wait
+            ready = None
+            for chat in self._pending:
+                chat_wait = max(self._blocked_until.get(chat, 0) - now, self._bucket(chat).wait_time(now))
+                if chat_wait <= 0:
+                    ready = chat
+                    break
+                wait = chat_wait if not wait else min(wait, chat_wait)
+            if ready is None:
+                return wait
+            self._send_next(ready, now)
+        return None
+
+    def _send_next(self, chat, now):
+        # Popped and re-added at the end, so chats take turns
+        pending = self._pending.pop(chat)
+        tag, text, count = pending.popleft()
+        # Backlogged: merge what's queued for this chat into one message
+        while pending and len(text) + 2 + len(pending[0][1]) <= MESSAGE_LIMIT:
+            _, more, more_count = pending.popleft()
+            text += "\n\n" + more
+            count += more_count
+
+        self._global.take(now)
+        self._bucket(chat).take(now)
+        retry_after = self._post(tag, chat[0], chat[1], text, count)
+        if retry_after is not None:
+            self._blocked_until[chat] = time.monotonic() + retry_after
+            pending.appendleft([tag, text, count])
+        else:
+            for _ in range(count):
+                self.queue.task_done()
+        if pending:
+            self._pending[chat] = pending
+
+    def _post(self, tag, bot_token, chat_id, text, count=1):
+        """POST one message; returns the back-off in seconds if Telegram answered 429, else None"""
+        url = f"{self.api_url}/bot{bot_token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(url, json=payload, timeout=self.timeout)
+        except Exception as e:
+            METRICS.observe_telegram('sendMessage', time.perf_counter() - start, 'error')
+            get_logger(tag).error(f"Telegram exception: {e}")
+            return None
+        METRICS.observe_telegram('sendMessage', time.perf_counter() - start, _result_label(resp))
+        if resp.status_code == 429:
+            retry_after = retry_after_seconds(resp)
+            get_logger(tag).warning(f"Telegram rate limited - retrying in {retry_after}s")
+            return retry_after
+        if resp.status_code != 200:
+            get_logger(tag).error(f"Telegram send failed: HTTP {resp.status_code} - {resp.text}")
+        elif count > 1:
+            get_logger(tag).info(f"Telegram notification sent ({count} merged)")
+        else:
+            get_logger(tag).info("Telegram notification sent")
+        return None
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Wait until every queued message has been sent (or `timeout` passes); True if drained"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+
+        def wait():
+            self.queue.join()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        if not done.wait(timeout):
+            log.warning(f"⚠️  {self.queue.qsize()} notifications still queued after {timeout}s")
+            return False
+        return True
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Split on line boundaries into chunks of at most `limit` characters"""
+    chunks = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ''
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_digest(results, wall_time, failure_reasons=None):
+    """HTML summary of a run's result rows (failures first)"""
+    failure_reasons = failure_reasons or {}
+    ist = timezone(timedelta(hours=5, minutes=30))
+    timestamp = datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S")
+    ok = sum(1 for r in results if r['success'])
+
+    message = f"<b>Token Status - {ok}/{len(results)} generated</b>\n"
+    message += f"⏰ Time: <code>{timestamp}</code> | ⏳ Wall: <code>{wall_time:.1f}s</code>\n\n"
+    for r in sorted(results, key=lambda r: r['success']):
+        if r['success']:
+            message += f"✅ <code>{html.escape(r['user_id'])}</code> {r['duration']:.1f}s\n"
+        else:
+            reason = failure_reasons.get(r['user_id']) or r['error'] or "Unknown error"
+            message += f"❌ <code>{html.escape(r['user_id'])}</code> {r['duration']:.1f}s - {html.escape(reason[:100])}\n"
+    return message
+
+
+def send_digest(accounts, results, wall_time, notifier=None):
+    """Queue one digest (split as needed) per Telegram chat covering that chat's accounts"""
+    notifier = notifier or NOTIFIER
+    rows = {r['user_id']: r for r in results}
+    chats = {}
+    for account in accounts:
+        if account.user_id in rows and account.telegram_bot_token and account.telegram_chat_id:
+            chat = (account.telegram_bot_token, account.telegram_chat_id)
+            chats.setdefault(chat, []).append(rows[account.user_id])
+    if not chats:
+        log.warning("Digest not sent: no account has TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID")
+        return
+    for (bot_token, chat_id), chat_results in chats.items():
+        chunks = split_message(build_digest(chat_results, wall_time, notifier.failure_reasons))
+        for chunk in chunks:
+            notifier.send(TAG, bot_token, chat_id, chunk)
+        log.info(f"Digest for {len(chat_results)} accounts queued ({len(chunks)} messages)")
+
+
+class StatusBoard:
+    """Live fleet status: one Telegram message per chat, edited in place as accounts finish
+
+    update() and mark_staged() only change in-memory rows; a background
+    thread sends the message at start and then edits it (editMessageText) at
+    most once per `interval` while anything changed - one request per chat
+    per interval, however many accounts finish in it.
+    """
+
+    ICONS = {'failed': '❌', 'ok': '✅', 'staged': '⏸️', 'waiting': '⏳'}  # also the listing order
+
+    def __init__(self, accounts, title="Stocko login", api_url=TELEGRAM_API, interval=BOARD_INTERVAL,
+                 timeout=SEND_TIMEOUT, notifier=None):
+        self.title = title
+        self.notifier = notifier or NOTIFIER  # for the failure reasons the engines reported
+        self.api_url = api_url
+        self.interval = interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.chats = {}  # (bot_token, chat_id) -> user_ids on that chat's board
+        for account in accounts:
+            if account.telegram_bot_token and account.telegram_chat_id:
+                chat = (account.telegram_bot_token, account.telegram_chat_id)
+                self.chats.setdefault(chat, []).append(account.user_id)
+        self.rows = {a.user_id: {'state': 'waiting', 'duration': None, 'error': None} for a in accounts}
+        self.message_ids = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._closing = False
+        self._thread = None
+        self._published = {}      # chat -> last text sent (Telegram rejects edits that change nothing)
+        self._blocked_until = {}  # chat -> monotonic time its 429 back-off ends
+
+    def start(self):
+        """Post the boards (in the background) and start following updates"""
+        if not self.chats:
+            log.warning("Status board not started: no account has TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID")
+            return self
+        self._thread = threading.Thread(target=self._run, name="telegram-status-board", daemon=True)
+        self._thread.start()
+        return self
+
+    def mark_staged(self, user_id):
+        self._set(user_id, state='staged')
+
+    def update(self, result):
+        """Record a finished account from its result row"""
+        error = self.notifier.failure_reasons.get(result['user_id']) or result['error']
+        self._set(result['user_id'], state='ok' if result['success'] else 'failed',
+                  duration=result['duration'], error=error)
+
+    def _set(self, user_id, **changes):
+        with self._lock:
+            self.rows[user_id].update(changes)
+        self._changed.set()
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """Publish the final state and stop the updater"""
+        if self._thread is None:
+            return
+        self._closing = True
+        self._changed.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            final = self._closing
+            self._changed.clear()
+            for chat in self.chats:
+                self._publish(chat, final)
+            if final:
+                return
+            time.sleep(self.interval)
+            self._changed.wait()
+
+    def _publish(self, chat, final):
+        if chat in self.message_ids and self.message_ids[chat] is None:
+            return  # posted but not editable, don't post it again
+        wait = self._blocked_until.get(chat, 0) - time.monotonic()
+        if wait > 0:
+            if not final:
+                self._changed.set()  # still dirty - try again next round
+                return
+            time.sleep(wait)
+        text = self.render(chat, final)
+        if text == self._published.get(chat):
+            return
+        bot_token, chat_id = chat
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+        if chat in self.message_ids:
+            method = 'editMessageText'
+            payload['message_id'] = self.message_ids[chat]
+        else:
+            method = 'sendMessage'
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(f"{self.api_url}/bot{bot_token}/{method}", json=payload, timeout=self.timeout)
+        except Exception as e:
+            METRICS.observe_telegram(method, time.perf_counter() - start, 'error')
+            log.error(f"Status board exception: {e}")
+            return
+        METRICS.observe_telegram(method, time.perf_counter() - start, _result_label(resp))
+        if resp.status_code == 429:
+            self._blocked_until[chat] = time.monotonic() + retry_after_seconds(resp)
+            if final:
+                self._publish(chat, final)
+            else:
+                self._changed.set()
+            return
+        if resp.status_code != 200:
+            log.error(f"Status board {method} failed: HTTP {resp.status_code} - {resp.text}")
+            return
+        self._published[chat] = text
+        if method == 'sendMessage':
+            try:
+                self.message_ids[chat] = resp.json()['result']['message_id']
+            except (ValueError, KeyError, TypeError):
+                self.message_ids[chat] = None
+                log.warning("⚠️  Status board sent, but no message_id came back - it can't be updated")
+
+    def render(self, chat, final=False):
+        """HTML board for one chat, cut to Telegram's size limit"""
+        with self._lock:
+            rows = [(user_id, dict(self.rows[user_id])) for user_id in self.chats[chat]]
+        counts = dict.fromkeys(self.ICONS, 0)
+        for _, row in rows:
+            counts[row['state']] += 1
+
+        message = f"<b>{html.escape(self.title)} - {'done' if final else 'running'}</b>\n"
+        message += " | ".join(f"{icon} {counts[state]}" for state, icon in self.ICONS.items())
+        message += f" | ⏱️ {time.time() - self.started_at:.0f}s\n\n"
+        lines = []
+        for state, icon in self.ICONS.items():
+            for user_id, row in rows:
+                if row['state'] != state:
+                    continue
+                line = f"{icon} <code>{html.escape(user_id)}</code>"
+                if row['duration'] is not None:
+                    line += f" {row['duration']:.1f}s"
+                if state == 'failed' and row['error']:
+                    line += f" - {html.escape(row['error'][:100])}"
+                lines.append(line + "\n")
+        for shown, line in enumerate(lines):
+            if len(message) + len(line) > MESSAGE_LIMIT - 40:
+                message += f"… and {len(lines) - shown} more\n"
+                break
+            message += line
+        return message
+
+
+NOTIFIER = TelegramNotifier()
+atexit.register(NOTIFIER.flush)
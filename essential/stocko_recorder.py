@@ -0,0 +1,206 @@
+"""
+Login traffic recorder
+Captures every request/response hop of a login (redirects included) into a
+compact HAR-like archive: timings, headers, redirect targets and bodies, with
+passwords, TOTP codes, auth codes, cookies and tokens redacted. Entries are
+kept in memory and written once at the end of the run, so recording costs a
+list append per hop rather than a file write.
+
+While recording, bodies are read in full (the streamed login/twofa pages are
+not cut off at </form>), so captured pages have their real size.
+
+Usage:
+  python stocko_batch_login.py --record run.har.json GJ114 PP450     (or STOCKO_RECORD=run.har.json)
+  python stocko_async_login.py --record run.har.json.gz GJ114 PP450  (gzipped if the name ends in .gz)
+
+Archive (HAR 1.2 subset, entries tagged with their account):
+  {"log": {"version": "1.2", "creator": {...}, "entries": [
+    {"_account": "GJ114", "startedDateTime": "...", "time": 212.4,
+     "request": {"method": "POST", "url": "...", "headers": [...], "postData": {...}},
+     "response": {"status": 302, "headers": [...], "redirectURL": "...", "content": {...}},
+     "timings": {"wait": 210.9, "receive": 1.5}}, ...]}}
+"""
+import re
+import gzip
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from stocko_log import get_logger
+
+TAG = "RECORD"
+log = get_logger(TAG)
+HAR_VERSION = '1.2'
+REDACTED = '***'
+BODY_LIMIT = 512 * 1024  # bytes of each body kept
+
+SECRET_FIELDS = {'password', 'answers[]', 'totp', 'otp', 'client_secret'}
+SECRET_PARAMS = {'code', 'access_token', 'refresh_token', 'id_token', 'token', 'auth_token'}
+SECRET_HEADERS = {'authorization', 'proxy-authorization'}
+TEXT_TYPES = ('text/', 'json', 'javascript', 'xml', 'x-www-form-urlencoded')
+AUTH_PATH = re.compile(r'(/auth/)[^/?#]+')  # /auth/{auth_code} - the code is a secret too
+TOKEN_IN_BODY = re.compile(
+    r'''((?:access|refresh|id)_token["']?\s*[:=]\s*["']?)([^"'&\s<]+)''', re.IGNORECASE)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds')
+
+
+def redact_url(url):
+    """URL with the auth code in its path and token-like query parameters blanked"""
+    parts = urlsplit(url)
+    if '/auth/' in parts.path:
+        parts = parts._replace(path=AUTH_PATH.sub(r'\g<1>' + REDACTED, parts.path))
+    if not parts.query:
+        return urlunsplit(parts)
+    query = [(k, REDACTED if k.lower() in SECRET_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query, safe='*[]')))
+
+
+def redact_form(body):
+    """urlencoded request body with password / TOTP fields blanked"""
+    pairs = parse_qsl(body, keep_blank_values=True)
+    return urlencode([(k, REDACTED if k.lower() in SECRET_FIELDS else v) for k, v in pairs], safe='*[]')
+
+
+def _redact_cookie(value):
+    """Cookie: 'a=1; b=2' -> 'a=***; b=***'"""
+    return '; '.join(f"{c.split('=', 1)[0].strip()}={REDACTED}" for c in value.split(';') if c.strip())
+
+
+def _redact_set_cookie(value):
+    """Set-Cookie: the value is blanked, the attributes (Path, Expires, ...) kept"""
+    name, _, attributes = value.partition(';')
+    return f"{name.split('=', 1)[0]}={REDACTED}" + (';' + attributes if attributes else '')
+
+
+def redact_headers(pairs):
+    """HAR header list with credentials and cookie values blanked"""
+    headers = []
+    for name, value in pairs:
+        lower = name.lower()
+        if lower in SECRET_HEADERS:
+            value = REDACTED
+        elif lower == 'cookie':
+            value = _redact_cookie(value)
+        elif lower == 'set-cookie':
+            value = _redact_set_cookie(value)
+        elif lower in ('location', 'referer'):
+            value = redact_url(value)
+        headers.append({'name': name, 'value': value})
+    return headers
+
+
+def _header_pairs(headers):
+    """(name, value) pairs, one per value (repeated Set-Cookie headers stay separate)"""
+    if hasattr(headers, 'getlist'):  # urllib3 HTTPHeaderDict
+        return [(name, value) for name in headers.keys() for value in headers.getlist(name)]
+    return list(headers.items())
+
+
+def _content(body, mime_type, charset):
+    content = {'size': len(body), 'mimeType': mime_type}
+    if body and any(t in mime_type for t in TEXT_TYPES):
+        text = body[:BODY_LIMIT].decode(charset or 'utf-8', errors='replace')
+        content['text'] = TOKEN_IN_BODY.sub(lambda m: m.group(1) + REDACTED, text)
+    return content
+
+
+class TrafficRecorder:
+    """Buffers redacted HAR entries for every login hop; save() writes them out in one go"""
+
+    def __init__(self):
+        self.enabled = False
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Record from now on (engines created afterwards hook themselves in)"""
+        self.enabled = True
+        return self
+
+    def attach(self, session, account):
+        """Record every response of a requests Session (redirect hops included) for `account`"""
+        def hook(response, *args, **kwargs):
+            self._record_requests(account, response)
+        session.hooks['response'].append(hook)
+
+    def record(self, account, method, url, request_headers, request_body, status, response_headers,
+               body, started, wait, receive, mime_type='', charset=None, redirect_url=''):
+        """Add one hop (the entry point for engines that aren't requests-based; None = not timed)"""
+        request = {'method': method, 'url': redact_url(url), 'headers': redact_headers(request_headers)}
+        if request_body:
+            if isinstance(request_body, bytes):
+                request_body = request_body.decode('utf-8', errors='replace')
+            request['postData'] = {'mimeType': 'application/x-www-form-urlencoded', 'text': redact_form(request_body)}
+        entry = {
+            '_account': account,
+            'startedDateTime': _iso(started),
+            'time': _ms((wait or 0) + (receive or 0)),
+            'request': request,
+            'response': {
+                'status': status,
+                'headers': redact_headers(response_headers),
+                'redirectURL': redact_url(redirect_url),
+                'content': _content(body, mime_type, charset),
+            },
+            'timings': {'wait': None if wait is None else _ms(wait),
+                        'receive': None if receive is None else _ms(receive)},
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+    def _record_requests(self, account, response):
+        try:
+            wait = response.elapsed.total_seconds()
+            read_start = time.perf_counter()
+            body = response.content  # the whole body, also for stream=True responses
+            receive = time.perf_counter() - read_start
+            request = response.request
+            self.record(
+                account, request.method, response.url, request.headers.items(), request.body,
+                response.status_code, _header_pairs(getattr(response.raw, 'headers', None) or response.headers),
+                body, time.time() - wait - receive, wait, receive,
+                mime_type=response.headers.get('Content-Type', ''), charset=response.encoding,
+                redirect_url=response.headers.get('Location', '') if response.is_redirect else '',
+            )
+        except Exception as e:
+            log.warning(f"⚠️  Could not record {response.url}: {e}")
+
+    def archive(self):
+        """Everything recorded so far as a HAR-like dict"""
+        with self._lock:
+            entries = list(self.entries)
+        return {'log': {'version': HAR_VERSION, 'creator': {'name': 'stocko_recorder', 'version': '1'},
+                        'entries': entries}}
+
+    def save(self, path):
+        """Write the archive in one go (gzipped if `path` ends in .gz)"""
+        data = json.dumps(self.archive(), separators=(',', ':'), ensure_ascii=False).encode()
+        try:
+            if str(path).endswith('.gz'):
+                data = gzip.compress(data)
+            with open(path, 'wb') as f:
+                f.write(data)
+            log.info(f"{len(self.entries)} requests recorded to {path} ({len(data) // 1024} KB)")
+        except OSError as e:
+            log.warning(f"⚠️  Could not write {path}: {e}")
+
+
+def load_archive(path):
+    """Entries of an archive written by TrafficRecorder.save() (gzipped or not)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if str(path).endswith('.gz'):
+        data = gzip.decompress(data)
+    return json.loads(data)['log']['entries']
+
+
+RECORDER = TrafficRecorder()
@@ -0,0 +1,64 @@
+"""
+Stocko response classification
+Each login response is scanned once with precompiled case-insensitive
+patterns and mapped to one outcome, instead of lowercasing (and for
+requests, decoding) the whole body again for every substring check.
+
+Bodies can be raw bytes (response.content - no decode, no charset
+detection) or text that was already decoded for form extraction.
+"""
+import re
+
+SUCCESS = 'success'
+BAD_CREDENTIALS = 'bad_credentials'
+BAD_TOTP = 'bad_totp'
+UNEXPECTED = 'unexpected'
+TWOFA_FORM = 'twofa_form'  # on the TOTP page, but no answers[] field in its form
+
+MIN_BODY_SIZE = 10  # anything shorter isn't a real page
+
+
+def _compile(pattern):
+    """(str pattern, bytes pattern) pair so both kinds of body can be scanned as-is"""
+    return (re.compile(pattern, re.IGNORECASE),
+            re.compile(pattern.encode('ascii'), re.IGNORECASE))
+
+
+# After submitting credentials (step 3)
+LOGIN_ERROR = _compile(r'invalid credentials|login failed|<error>')
+TWOFA_PATH = re.compile(r'/oauth/twofa', re.IGNORECASE)
+TWOFA_URL = re.compile(r'twofa', re.IGNORECASE)
+# After submitting the TOTP (steps 5-6); a rejection wins over any 'success'
+TOTP_RESULT = _compile(r'(?P<rejected>invalid|incorrect)|(?P<success>success)')
+SUCCESS_URL = re.compile(r'success', re.IGNORECASE)
+
+
+def _pick(patterns, body):
+    return patterns[1] if isinstance(body, (bytes, bytearray)) else patterns[0]
+
+
+def classify_login_response(url, body):
+    """Outcome of the credentials POST: SUCCESS means we are on the TOTP page"""
+    if _pick(LOGIN_ERROR, body).search(body):
+        return BAD_CREDENTIALS
+    if TWOFA_PATH.search(url):
+        return SUCCESS
+    if '/oauth/login' in url:
+        return BAD_CREDENTIALS  # redirected back to the login form
+    if TWOFA_URL.search(url):
+        return SUCCESS
+    return UNEXPECTED
+
+
+def classify_totp_response(url, body):
+    """Outcome of the TOTP POST: SUCCESS, BAD_TOTP or UNEXPECTED"""
+    found_success = False
+    for match in _pick(TOTP_RESULT, body).finditer(body):
+        if match.lastgroup == 'rejected':
+            return BAD_TOTP
+        found_success = True
+    if len(body) < MIN_BODY_SIZE:
+        return UNEXPECTED
+    if found_success or SUCCESS_URL.search(url):
+        return SUCCESS
+    return UNEXPECTED
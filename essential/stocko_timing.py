@@ -0,0 +1,102 @@
+"""
+Per-step login timing
+Every step of a login is timed with time.perf_counter() (wall) and
+time.thread_time() (CPU used by this thread); what's left of the wall time is
+waiting on the network. One JSON line per login is appended to the file in
+STOCKO_TIMINGS, or logged (tag TIMING) if it isn't set.
+
+Record:
+  {"event": "login_timing", "user_id": "GJ114", "engine": "sync", "success": true,
+   "outcome": "success", "started_at": 1760000000.0, "total_ms": 812.4, "active_ms": 805.1,
+   "steps": [{"step": "auth_get", "wall_ms": 301.2, "cpu_ms": 4.1, "network_ms": 297.1}, ...]}
+
+total_ms runs from the start of prepare() to the end of commit(), so in two-phase
+runs it includes the hold; active_ms is the sum of the steps.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from stocko_metrics import METRICS
+from stocko_log import get_logger
+
+TIMINGS_ENV = 'STOCKO_TIMINGS'
+log = get_logger('TIMING')
+_write_lock = threading.Lock()
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class StepTimer:
+    """Wall / CPU / network split for each step of one login
+
+    `shared_thread` is for the asyncio engine: while a coroutine awaits, other
+    logins run on the same thread, so a network step's CPU can't be told
+    apart and only its wall time is kept. Steps with no await (form
+    extraction, verification) are measured exactly either way.
+    """
+
+    def __init__(self, user_id, engine, shared_thread=False):
+        self.user_id = user_id
+        self.engine = engine
+        self.shared_thread = shared_thread
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.steps = []
+
+    @contextmanager
+    def step(self, name, network=True):
+        """Time the block as step `name` (network=False for pure CPU work)"""
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            if not network:
+                network_time = 0.0
+            elif self.shared_thread:
+                cpu, network_time = None, wall
+            else:
+                network_time = max(0.0, wall - cpu)
+            self.steps.append({
+                'step': name,
+                'wall_ms': _ms(wall),
+                'cpu_ms': None if cpu is None else _ms(cpu),
+                'network_ms': _ms(network_time),
+            })
+
+    def record(self, success, outcome=None):
+        """The login's timing record as a dict"""
+        return {
+            'event': 'login_timing',
+            'user_id': self.user_id,
+            'engine': self.engine,
+            'success': bool(success),
+            'outcome': outcome,
+            'started_at': round(self.started_at, 3),
+            'total_ms': _ms(time.perf_counter() - self._start),
+            'active_ms': round(sum(s['wall_ms'] for s in self.steps), 2),
+            'steps': self.steps,
+        }
+
+    def emit(self, success, outcome=None):
+        """Write the record as one JSON line (STOCKO_TIMINGS file, else the log) and feed the metrics"""
+        record = self.record(success, outcome)
+        METRICS.observe_login(record)
+        line = json.dumps(record)
+        path = os.getenv(TIMINGS_ENV)
+        if not path:
+            log.info(line)  # through the log queue, so it can't interleave with other lines
+            return
+        with _write_lock:
+            try:
+                with open(path, 'a') as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                log.warning(f"⚠️  Could not write {path}: {e}")
@@ -0,0 +1,131 @@
+"""
+TOTP timing helpers
+Retry timing computed from the 30-second TOTP time-step instead of a flat sleep,
+and codes generated for the Stocko server's clock rather than the runner's
+
+The clock skew estimate is cached between runs in .totp_skew.json next to
+this file, or in STOCKO_TOTP_SKEW_CACHE. On GitHub Actions every job starts
+from a fresh checkout, so the workflows point it outside the checkout and
+keep it with actions/cache.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+
+from stocko_log import get_logger
+
+TOTP_STEP = 30          # seconds per TOTP code (RFC 6238 default, used by Stocko)
+BOUNDARY_GRACE = 2.0    # seconds either side of a step boundary treated as "at the boundary"
+
+SKEW_CACHE_ENV = 'STOCKO_TOTP_SKEW_CACHE'
+SKEW_CACHE_PATH = Path(os.getenv(SKEW_CACHE_ENV) or Path(__file__).parent / '.totp_skew.json').expanduser()
+SKEW_CACHE_MAX_AGE = 24 * 3600  # ignore cached skew older than a day
+
+
+def step_index(at, step=TOTP_STEP):
+    """TOTP counter for a unix timestamp"""
+    return int(at // step)
+
+
+def seconds_until_next_step(at, step=TOTP_STEP):
+    """Time left in the step containing `at`"""
+    return step - (at % step)
+
+
+def plan_totp_retry(code_time, tried_steps=(), now=None, step=TOTP_STEP, grace=BOUNDARY_GRACE):
+    """Decide when to retry a rejected TOTP and which time to generate the code for
+
+    `code_time` is the time the rejected code was generated for and
+    `tried_steps` the step indexes already submitted. Returns
+    (delay_seconds, code_time):
+      - step already rolled over since the rejected code: retry now with
+        the current code
+      - rejected code was for the first moments of its step (server clock may
+        still be in the previous step): retry now with the previous code
+      - otherwise: wait only until the next step starts, then use its code
+    """
+    now = time.time() if now is None else now
+    tried = set(tried_steps) | {step_index(code_time, step)}
+    if step_index(now, step) not in tried:
+        return 0.0, now
+    at_boundary = step_index(code_time, step) == step_index(now, step) and code_time % step < grace
+    if at_boundary and step_index(code_time - step, step) not in tried:
+        return 0.0, code_time - step
+    delay = seconds_until_next_step(now, step)
+    return delay, now + delay
+
+
+class ClockSkew:
+    """Offset of the server clock from the runner clock (server time = local time + offset)
+
+    Every HTTP `Date` header pins the server time to a 1-second window that was
+    stamped somewhere between our request being sent and the response arriving.
+    Intersecting those windows across samples narrows the offset well below the
+    header's 1-second resolution. Until a run has its own samples, the estimate
+    cached by the previous run is used.
+    """
+
+    def __init__(self, cache_path=SKEW_CACHE_PATH):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.low = float('-inf')
+        self.high = float('inf')
+        self.samples = 0
+        self.cached_offset = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self.cache_path or not self.cache_path.exists():
+            return None
+        try:
+            data = json.loads(self.cache_path.read_text())
+            if time.time() - data['updated'] > SKEW_CACHE_MAX_AGE:
+                return None
+            return float(data['offset'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def record(self, date_header, sent_at, received_at):
+        """Add one sample from a response's Date header and our send/receive timestamps"""
+        try:
+            server_time = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            return
+        low = server_time - received_at
+        high = server_time + 1 - sent_at
+        with self._lock:
+            if max(self.low, low) > min(self.high, high):
+                # Disjoint with earlier samples - a clock stepped, start over
+                self.low, self.high, self.samples = low, high, 0
+            else:
+                self.low, self.high = max(self.low, low), min(self.high, high)
+            self.samples += 1
+
+    @property
+    def offset(self):
+        if self.samples:
+            return (self.low + self.high) / 2
+        if self.cached_offset is not None:
+            return self.cached_offset
+        return 0.0
+
+    def now(self):
+        """Current time on the server's clock"""
+        return time.time() + self.offset
+
+    def save(self):
+        """Cache this run's estimate for the next run"""
+        if not self.cache_path or not self.samples:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps({
+                'offset': round(self.offset, 3),
+                'uncertainty': round((self.high - self.low) / 2, 3),
+                'samples': self.samples,
+                'updated': time.time(),
+            }))
+        except OSError as e:
+            get_logger("TOTP").warning(f"⚠️  Could not cache clock skew: {e}")
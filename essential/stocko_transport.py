@@ -0,0 +1,173 @@
+"""
+Stocko HTTP transport helpers
+- Shared connection pools for fleet runs: every account keeps its own
+  cookie jar and headers, but all of them reuse one pool per host
+- Connection pre-warming so DNS lookups and TCP+TLS handshakes to
+  sasstocko.broker.tradetron.tech and api.stocko.in are paid before the
+  timed login flow starts, not inside it
+"""
+import time
+import socket
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+from stocko_log import get_logger
+
+TAG = "PREWARM"
+log = get_logger(TAG)
+PREWARM_TIMEOUT = 10
+PREWARM_MAX_CONNECTIONS = 10  # per host, for large asyncio fleets
+PREWARM_LEAD = 5              # seconds before a two-phase trigger to top the pool up
+STREAM_CHUNK_SIZE = 4096
+STREAM_DRAIN_MAX = 64 * 1024  # unread tail worth draining to keep the connection pooled
+POOL_HOSTS = 4                # sasstocko + api.stocko.in, with headroom
+
+
+def create_shared_adapter(pool_maxsize):
+    """One requests adapter (urllib3 pools) to mount on every account's Session
+
+    Size it to the fleet concurrency so workers don't open and throw away
+    extra connections. Cookies stay on each Session, so accounts never share
+    login state. Don't call Session.close() on sessions using it - that
+    would close the shared pools.
+    """
+    return HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=max(1, pool_maxsize))
+
+
+def create_shared_connector(limit):
+    """aiohttp equivalent of create_shared_adapter() for the asyncio engine"""
+    import aiohttp
+    return aiohttp.TCPConnector(limit=max(1, limit), limit_per_host=max(1, limit))
+
+
+def _resolve(host, port):
+    """DNS lookup for one host, returns seconds taken"""
+    start = time.perf_counter()
+    socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return time.perf_counter() - start
+
+
+def _print_report(report):
+    for host, r in report.items():
+        if r.get('error'):
+            log.warning(f"⚠️  {host}: {r['error']}")
+        else:
+            log.info(f"{host}: dns {r['dns'] * 1000:.0f}ms, "
+                     f"{r['connections']} conn in {r['connect'] * 1000:.0f}ms")
+
+
+def _session_pool(session, url):
+    """The urllib3 pool the session's own requests to `url` will check connections out of
+
+    requests 2.32+ keys pools on the TLS settings as well as the host, so
+    connection_from_url() would hand back a different pool there. The
+    settings are merged the way Session.request() does (REQUESTS_CA_BUNDLE,
+    proxy variables), otherwise the CA bundle alone gives a separate pool.
+    """
+    adapter = session.get_adapter(url)
+    if hasattr(adapter, 'get_connection_with_tls_context'):
+        settings = session.merge_environment_settings(url, {}, None, None, None)
+        request = requests.Request('HEAD', url).prepare()
+        return adapter.get_connection_with_tls_context(
+            request, settings['verify'], settings['proxies'], settings['cert'])
+    return adapter.poolmanager.connection_from_url(url)
+
+
+def prewarm_session(session, urls, connections=1, timeout=PREWARM_TIMEOUT):
+    """Resolve each host and open `connections` keep-alive connections in a requests Session's pool
+
+    All `connections` are checked out of the session's urllib3 pool at once,
+    connected in parallel and put back, so each one is a separate socket
+    (requests made one after another would keep reusing the first). Nothing
+    is sent, so no cookies or redirects leak into the session. Returns
+    {host: timings}, with the number of connections actually open.
+    """
+    report = {}
+    for url in urls:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        r = report[parts.netloc] = {'dns': 0.0, 'connect': 0.0, 'connections': 0, 'error': None}
+        try:
+            r['dns'] = _resolve(parts.hostname, port)
+            pool = _session_pool(session, url)
+            # More than the pool keeps would just be discarded when put back
+            checked_out = [pool._get_conn() for _ in range(max(1, min(connections, pool.pool.maxsize)))]
+
+            def open_one(conn):
+                if not conn.is_connected:
+                    conn.timeout = timeout
+                    conn.connect()
+
+            start = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(max_workers=len(checked_out)) as pool_threads:
+                    list(pool_threads.map(open_one, checked_out))
+            finally:
+                r['connections'] = sum(conn.is_connected for conn in checked_out)
+                for conn in checked_out:
+                    pool._put_conn(conn)
+            r['connect'] = time.perf_counter() - start
+        except Exception as e:
+            r['error'] = f"{type(e).__name__}: {str(e)[:100]}"
+    _print_report(report)
+    return report
+
+
+def finish_stream(response, max_drain=STREAM_DRAIN_MAX):
+    """Finish a partly read streamed requests response
+
+    A short unread tail is drained so the keep-alive connection goes back to
+    the pool (a new TLS handshake costs far more than a few KB); anything
+    larger is cut off by closing the connection.
+    """
+    drained = 0
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        drained += len(chunk)
+        if drained > max_drain:
+            response.close()
+            return
+
+
+async def finish_stream_async(response, max_drain=STREAM_DRAIN_MAX):
+    """aiohttp version of finish_stream()"""
+    drained = 0
+    while not response.content.at_eof():
+        chunk = await response.content.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return
+        drained += len(chunk)
+        if drained > max_drain:
+            response.close()
+            return
+
+
+async def prewarm_connector(connector, urls, connections=1, timeout=PREWARM_TIMEOUT):
+    """asyncio version of prewarm_session() for a shared aiohttp connector"""
+    import asyncio
+    import aiohttp
+
+    report = {}
+    # Throwaway session: its cookie jar is discarded, only the connector's pool is kept
+    async with aiohttp.ClientSession(connector=connector, connector_owner=False,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        for url in urls:
+            parts = urlsplit(url)
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+            r = report[parts.netloc] = {'dns': 0.0, 'connect': 0.0, 'connections': 0, 'error': None}
+            try:
+                r['dns'] = await asyncio.to_thread(_resolve, parts.hostname, port)
+
+                async def open_one():
+                    async with session.head(f"{parts.scheme}://{parts.netloc}/", allow_redirects=False) as resp:
+                        await resp.read()
+
+                start = time.perf_counter()
+                await asyncio.gather(*(open_one() for _ in range(connections)))
+                r['connect'] = time.perf_counter() - start
+                r['connections'] = connections
+            except Exception as e:
+                r['error'] = f"{type(e).__name__}: {str(e)[:100]}"
+    _print_report(report)
+    return report